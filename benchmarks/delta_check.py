@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Consistency check of "code.py update": on a copy of a dataset and of the rules file, files are added, changed and deleted and the
+# rules are edited (aliases, brands, exceptions, equivalences), one change at a time; after each of them the matches of the previous
+# run with the delta written by update applied must be the matches of a full run
+
+import argparse
+import collections
+import csv
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# code.py cannot be imported by name (it would be the standard library "code" module)
+code_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code.py')
+spec = importlib.util.spec_from_file_location('camera_er', code_path)
+er = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(er)
+
+def read_titles(path):
+
+	titles = []
+
+	for folder_name in sorted(os.listdir(path)):
+		for file_name in sorted(os.listdir(path + '/' + folder_name)):
+			titles.append((folder_name, file_name, er.read_title(path, folder_name, file_name)))
+
+	return titles
+
+def write_spec(path, title):
+
+	with open(path, 'w') as data:
+		json.dump({'<page title>': title}, data)
+
+def read_pairs(path):
+
+	with open(path, 'r', newline='') as data:
+		return set(tuple(row[:2]) for row in list(csv.reader(data))[1:])
+
+def apply_delta(pairs, path):
+
+	with open(path, 'r', newline='') as data:
+		rows = list(csv.reader(data))[1:]
+	for left, right, operation in rows:
+		if operation == 'add':
+			pairs.add((left, right))
+		else:
+			pairs.discard((left, right))
+
+	return len(rows)
+
+def edits(titles, table, resolver):
+
+	# Changes checked, in order: each is a name and a function applied to the dataset folder and to the rules table. They are chosen
+	# from the most frequent brands and models of the dataset, so that each of them changes some matches
+	labels = collections.Counter()
+	tokens = collections.Counter()
+	for folder_name, file_name, title in titles:
+		result = resolver.resolve(title)
+		if result['cluster'] is not None:
+			labels[(result['brand'], result['model'])] += 1
+		tokens.update(set(er.normalize_title(title, resolver.rules).split()))
+
+	models = collections.defaultdict(list)
+	for (brand, model), count in labels.most_common():
+		models[brand].append(model)
+	ruled = [brand for brand in models if brand in table['brand_rules'] and len(models[brand]) >= 2]
+	# Removed brand: one of middle size among those with matches (the smallest ones may only match identical titles anyway)
+	paired = sorted(set(brand for (brand, model), count in labels.items() if count >= 2), key=lambda brand: (sum(labels[(brand, model)] for model in models[brand]), brand))
+	removed = paired[len(paired) // 2]
+	alias = max((token for token in table['aliases'] if tokens[token] > 0), key=lambda token: tokens[token])
+
+	(folder_name, file_name, title), (other_folder, other_file, other_title) = titles[0], titles[len(titles) // 2]
+
+	def add_file(path, table):
+		write_spec(os.path.join(path, folder_name, 'delta-check.json'), other_title)
+
+	def change_file(path, table):
+		write_spec(os.path.join(path, folder_name, file_name), other_title)
+
+	def delete_file(path, table):
+		os.remove(os.path.join(path, other_folder, other_file))
+
+	def remove_alias(path, table):
+		del table['aliases'][alias]
+
+	def add_alias(path, table):
+		table['aliases'][models[ruled[0]][1]] = models[ruled[0]][0]
+
+	def remove_brand(path, table):
+		table['brands'].remove(removed)
+
+	def add_exception(path, table):
+		brand_table = table['brand_rules'][ruled[0]]
+		brand_table['exceptions'] = brand_table.get('exceptions', []) + [models[ruled[0]][0]]
+
+	def add_equivalence(path, table):
+		brand_table = table['brand_rules'][ruled[-1]]
+		brand_table['equivalences'] = dict(brand_table.get('equivalences', {}), **{models[ruled[-1]][1]: models[ruled[-1]][0]})
+
+	return [('add_file', add_file), ('change_file', change_file), ('delete_file', delete_file), ('remove_alias', remove_alias),
+			('add_alias', add_alias), ('remove_brand', remove_brand), ('add_exception', add_exception), ('add_equivalence', add_equivalence)]
+
+def run(arguments):
+
+	subprocess.run([sys.executable, code_path] + arguments, stdout=subprocess.DEVNULL, check=True)
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Consistency check of the delta written by code.py update')
+	parser.add_argument('--path', default='Dataset/2013_camera_specs', help='folder containing one subfolder of JSON specifications per source (copied, never modified)')
+	parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rules.json'), help='JSON file with normalization tables and brand rules (copied, never modified)')
+	args = parser.parse_args()
+
+	with open(args.rules, 'r') as data:
+		table = json.load(data)
+	titles = read_titles(args.path)
+	changes = edits(titles, table, er.Resolver(args.rules))
+
+	with tempfile.TemporaryDirectory() as folder:
+		path = os.path.join(folder, 'specs')
+		rules = os.path.join(folder, 'rules.json')
+		state = os.path.join(folder, 'state.db')
+		matches = os.path.join(folder, 'matches.csv')
+		delta = os.path.join(folder, 'delta.csv')
+		shutil.copytree(args.path, path)
+		shutil.copyfile(args.rules, rules)
+
+		run(['--path', path, '--rules', rules, '--state', state, '--output', matches])
+		pairs = read_pairs(matches)
+
+		results = {}
+		for name, change in changes:
+			change(path, table)
+			with open(rules, 'w') as data:
+				json.dump(table, data, indent='\t')
+
+			run(['update', '--path', path, '--rules', rules, '--state', state, '--delta', delta])
+			operations = apply_delta(pairs, delta)
+			run(['--path', path, '--rules', rules, '--output', matches])
+			expected = read_pairs(matches)
+
+			results[name] = {'delta': operations, 'missing': len(expected - pairs), 'extra': len(pairs - expected)}
+			pairs = expected
+
+	print(json.dumps(results, indent=1))
+	if any(result['missing'] > 0 or result['extra'] > 0 for result in results.values()):
+		sys.exit('the delta of update differs from a full run')
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Generator of synthetic corpora shaped like 2013_camera_specs (one folder per source, one JSON file per specification),
+# with titles built from the vocabulary of the rules file: brands, aliases, prefixes, models, equivalences and measures
+
+import argparse
+import itertools
+import json
+import os
+import random
+
+# Words surrounding brand and model in e-commerce titles
+FILLERS = ['digital camera', 'camera', 'black', 'silver', 'red', 'kit', 'body only', 'new', 'used', '(renewed)', 'with 18-55mm lens',
+		   '3x optical zoom', '10x zoom', '16mp', '20.1 mp', '24.2 megapixel', 'hd', '1080p', 'wifi', 'bundle', '8gb', '- ebay', '| ebay',
+		   'waterproof', 'dslr', 'mirrorless', 'point & shoot', 'compact', 'brand new', 'free shipping']
+
+def brand_models(brand, brand_table, count, rng):
+
+	# Model names of a brand: the ones listed in its rules, then prefixes (or letters) followed by numbers
+	models = list(brand_table.get('models', [])) + list(brand_table.get('equivalences', {}).keys()) + list(brand_table.get('mods', {}).keys())
+	prefixes = list(brand_table.get('prefixes', [])) or ['', 'a', 'c', 'dc', 'x']
+	suffixes = [''] * 4 + list(brand_table.get('suffixes', []))
+
+	while len(models) < count:
+		models.append(rng.choice(prefixes) + str(rng.randint(1, 9999)) + rng.choice(suffixes))
+
+	return models[:count]
+
+def render_model(model, rng):
+
+	# Models are written in several ways: attached, split after the prefix letters, hyphenated, uppercase
+	split = len(model) - len(model.lstrip('abcdefghijklmnopqrstuvwxyz'))
+	forms = [model, model.upper()]
+	if 0 < split < len(model):
+		forms += [model[:split] + ' ' + model[split:], model[:split].upper() + '-' + model[split:]]
+
+	return rng.choice(forms)
+
+def make_title(brand, spellings, model, rng):
+
+	words = [rng.choice(spellings), render_model(model, rng)]
+	if rng.random() < 0.3:
+		words[0] = words[0].capitalize()
+
+	return ' '.join(words + rng.sample(FILLERS, rng.randint(0, 4)))
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Generate a synthetic corpus shaped like 2013_camera_specs')
+	parser.add_argument('--output', default='Synthetic/2013_camera_specs', help='folder the sources are written to')
+	parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rules.json'), help='rules file the vocabulary is taken from')
+	parser.add_argument('--specs', type=int, default=10000, help='number of specifications (e.g. 10000, 100000, 1000000)')
+	parser.add_argument('--sources', type=int, default=24, help='number of sources')
+	parser.add_argument('--models', type=int, default=5000, help='number of distinct models (entities)')
+	parser.add_argument('--skew', type=float, default=1.1, help='exponent of the Zipf distribution of cluster sizes (0 gives uniform sizes)')
+	parser.add_argument('--duplicates', type=float, default=0.3, help='probability that a specification repeats the title of a previous one')
+	parser.add_argument('--unsolved', type=float, default=0.1, help='probability that a title has neither brand nor model')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the random generator (same seed, same corpus)')
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	with open(args.rules, 'r') as data:
+		rules = json.load(data)
+
+	# Brands are written with their own name or with one of their aliases
+	spellings = dict((brand, [brand]) for brand in rules['brands'])
+	for alias, brand in sorted(rules['aliases'].items()):
+		if brand in spellings:
+			spellings[brand].append(alias)
+
+	# Entities: models spread over brands, the ones with rules first
+	brands = sorted(rules['brands'], key=lambda b: (b not in rules['brand_rules'], b))
+	per_brand = max(1, args.models // len(brands))
+	entities = []
+	for brand in brands:
+		for model in brand_models(brand, rules['brand_rules'].get(brand, {}), per_brand, rng):
+			entities.append((brand, model))
+	rng.shuffle(entities)
+	entities = entities[:args.models]
+
+	# Zipf weights: a few very popular models, a long tail of rare ones
+	cum_weights = list(itertools.accumulate(1 / (k ** args.skew) for k in range(1, len(entities) + 1)))
+
+	sources = ['www.source%02d.com' % s for s in range(args.sources)]
+	for source in sources:
+		os.makedirs(os.path.join(args.output, source), exist_ok=True)
+
+	titles = []
+	for n in range(args.specs):
+		if len(titles) > 0 and rng.random() < args.duplicates:
+			title = rng.choice(titles)
+		elif rng.random() < args.unsolved:
+			title = ' '.join(rng.sample(FILLERS, rng.randint(1, 4)))
+		else:
+			brand, model = rng.choices(entities, cum_weights=cum_weights)[0]
+			title = make_title(brand, spellings[brand], model, rng)
+		titles.append(title)
+
+		spec = {'<page title>': title, 'brand': title.split()[0], 'megapixels': '%d mp' % rng.randint(8, 50)}
+		with open(os.path.join(args.output, rng.choice(sources), '%d.json' % n), 'w') as data:
+			json.dump(spec, data)
+
+	print(json.dumps({'specs': args.specs, 'sources': args.sources, 'entities': len(entities), 'distinct_titles': len(set(titles))}))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Benchmark of the stages of code.py, timed separately on a corpus (e.g. one made by generate.py):
+# file read, JSON parse, normalization, extraction, clustering, pair emission and CSV write.
+# Results are saved as JSON and can be compared with the ones of a previous run
+
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+
+# code.py cannot be imported by name (it would be the standard library "code" module)
+spec = importlib.util.spec_from_file_location('camera_er', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code.py'))
+er = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(er)
+
+def best_of(repeat, stage, *args):
+
+	# Best time of repeat runs (the least disturbed by the machine) and the result of the last one
+	best = None
+	for r in range(repeat):
+		start = time.perf_counter()
+		result = stage(*args)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+
+	return best, result
+
+def read_files(path):
+
+	contents = []
+	for folder_name in sorted(os.listdir(path)):
+		for file_name in sorted(os.listdir(path + '/' + folder_name)):
+			with open(path + '/' + folder_name + '/' + file_name, 'r') as data:
+				contents.append((folder_name + '//' + file_name[:-5], data.read()))
+
+	return contents
+
+def parse(contents):
+
+	titles = []
+	for spec_id, content in contents:
+		spec = json.loads(content)
+		spec = dict((k.lower(), v) for k, v in spec.items())
+		titles.append((spec_id, spec['<page title>']))
+
+	return titles
+
+def normalize(titles):
+
+	return list(zip([spec_id for spec_id, title in titles], er.normalize_titles([title for spec_id, title in titles], er.rules)))
+
+def extract(normalized):
+
+	# Without the title cache, so that every title is really resolved
+	specs = []
+	for spec_id, page_title in normalized:
+		camera = {'id': spec_id}
+		camera['page_title'], brand, model = er.resolve_title(page_title, er.rules)
+		camera['brand'] = brand
+		if (brand != 'none') and (model != 'none'):
+			camera['brand_n_model'] = brand + ' ' + model
+		specs.append(camera)
+
+	return specs
+
+def cluster(specs):
+
+	# Same grouping as the pipeline: the columnar store, with the ids of every cluster expanded
+	store = er.SpecStore()
+	for camera in specs:
+		store.add(camera)
+	store.freeze()
+
+	return list(store.clusters('label', True, 1)), list(store.clusters('title', False, 1))
+
+def emit_pairs(clusters):
+
+	# Pairs are generated but not written, to separate their cost from the one of the CSV
+	count = 0
+	for group in clusters:
+		for c, ids in group:
+			for pair in itertools.combinations(sorted(ids), 2):
+				count += 1
+
+	return count
+
+def write_csv(clusters, output):
+
+	with open(output, 'w', buffering=er.OUTPUT_BUFFER, newline='') as matches:
+		matches.write('left_spec_id,right_spec_id\n')
+		return sum(er.write_pairs(matches, group) for group in clusters)
+
+def compare(results, previous, tolerance):
+
+	# Stages slower than the previous run by more than tolerance (relative) are reported as regressions
+	regressions = []
+	for name, stage in results['stages'].items():
+		if name in previous['stages']:
+			ratio = stage['seconds'] / previous['stages'][name]['seconds']
+			print('%-14s %8.3fs -> %8.3fs  x%.2f' % (name, previous['stages'][name]['seconds'], stage['seconds'], ratio))
+			if ratio > 1 + tolerance:
+				regressions.append(name)
+
+	return regressions
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Benchmark of the stages of code.py')
+	parser.add_argument('--path', default='Synthetic/2013_camera_specs', help='folder containing one subfolder of JSON specifications per source')
+	parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rules.json'), help='JSON file with normalization tables and brand rules')
+	parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each stage (the best one is reported)')
+	parser.add_argument('--output', default='benchmark.json', help='JSON file the results are saved to')
+	parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare with')
+	parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown reported as a regression by --compare')
+	args = parser.parse_args()
+
+	er.init_worker(args.rules, 0)
+	stages = {}
+
+	def run(name, stage, *stage_args):
+		seconds, result = best_of(args.repeat, stage, *stage_args)
+		stages[name] = {'seconds': seconds, 'records_per_second': records / seconds if seconds > 0 else None}
+		return result
+
+	# Records are counted up front, to report the throughput of every stage
+	records = sum(len(os.listdir(args.path + '/' + folder_name)) for folder_name in os.listdir(args.path))
+
+	contents = run('file_read', read_files, args.path)
+	titles = run('json_parse', parse, contents)
+	normalized = run('normalization', normalize, titles)
+	specs = run('extraction', extract, normalized)
+	clusters = run('clustering', cluster, specs)
+	pairs = run('pair_emission', emit_pairs, clusters)
+
+	with tempfile.TemporaryDirectory() as directory:
+		run('csv_write', write_csv, clusters, os.path.join(directory, 'matches.csv'))
+
+	results = {'corpus': {'path': args.path, 'records': records, 'solved': sum(len(ids) for c, ids in clusters[0]), 'pairs': pairs},
+			   'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+			   'repeat': args.repeat, 'stages': stages}
+
+	with open(args.output, 'w') as data:
+		json.dump(results, data, indent=1)
+	print(json.dumps(results, indent=1))
+
+	if args.compare is not None:
+		with open(args.compare, 'r') as data:
+			regressions = compare(results, json.load(data), args.tolerance)
+		if len(regressions) > 0:
+			print('regressions: ' + ', '.join(regressions))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark of the title stage (normalization, aliases, brand and model extraction):
+# the current implementation of code.py against the previous one (kept below), on the titles of a dataset
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+
+# code.py cannot be imported by name (it would be the standard library "code" module)
+spec = importlib.util.spec_from_file_location('camera_er', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code.py'))
+er = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(er)
+
+# The previous implementation checked brands against a list
+reference_brands = []
+
+def reference_normalize_title(title, rules):
+
+	page_title = title.lower()
+	for p in rules.punctuation:
+		page_title = page_title.replace(p, ' ')
+	for c in rules.stop_chars:
+		page_title = page_title.replace(c, '')
+
+	return page_title
+
+def reference_resolve_title(page_title, rules):
+
+	splitted = page_title.split()
+
+	for s in splitted:
+		if s in rules.aliases.keys():
+			index = splitted.index(s)
+			splitted[index] = rules.aliases[s]
+			s = splitted[index]
+
+	brand = 'none'
+	for s in splitted:
+		if s in reference_brands:
+			brand = s
+			break
+
+	brand_rules = rules.brand_rules.get(brand, rules.default_rules)
+
+	if len(brand_rules.suffixes) > 0:
+		for i in range(1, len(splitted)):
+			if (splitted[i] in brand_rules.suffixes) and (splitted[i - 1].endswith(splitted[i]) == False):
+				splitted[i - 1] = splitted[i - 1] + splitted[i]
+
+	if len(brand_rules.prefixes) > 0:
+		for i in range(0, len(splitted) - 1):
+			if (splitted[i] in brand_rules.prefixes) and (splitted[i + 1].startswith(splitted[i]) == False):
+				splitted[i] = splitted[i] + splitted[i + 1]
+
+	model = 'none'
+	for s in splitted:
+		if ((bool(re.match('^(?=.*[0-9])(?=.*[a-z])', s)) == True) and (s not in brand_rules.exceptions)) or (s in brand_rules.models):
+			is_measure = False
+			for m in rules.measures:
+				if s.endswith(m):
+					is_measure = True
+			if is_measure == False:
+				model = s
+				break
+
+	if model != 'none' and brand_rules.fix_model is not None:
+		model = brand_rules.fix_model(model, page_title, brand_rules)
+
+	if model in brand_rules.equivalences:
+		model = brand_rules.equivalences[model]
+
+	return ' '.join(splitted), brand, model
+
+def read_titles(path):
+
+	titles = []
+
+	for folder_name in sorted(os.listdir(path)):
+		for file_name in sorted(os.listdir(path + '/' + folder_name)):
+			titles.append(er.read_title(path, folder_name, file_name))
+
+	return titles
+
+def time_stage(normalize, resolve, rules, titles, repeat):
+
+	# Best of repeat runs, to reduce the noise of the machine
+	best = None
+	for r in range(repeat):
+		start = time.perf_counter()
+		for title in titles:
+			resolve(normalize(title, rules), rules)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+
+	return best
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Micro-benchmark of the title stage of code.py')
+	parser.add_argument('--path', default='Dataset/2013_camera_specs', help='folder containing one subfolder of JSON specifications per source')
+	parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rules.json'), help='JSON file with normalization tables and brand rules')
+	parser.add_argument('--repeat', type=int, default=5, help='number of timed runs (the best one is reported)')
+	args = parser.parse_args()
+
+	er.init_worker(args.rules, 0)
+	reference_brands.extend(sorted(er.rules.brands))
+	titles = read_titles(args.path)
+
+	# Both implementations must give the same result on every title
+	differences = 0
+	for title in titles:
+		if reference_resolve_title(reference_normalize_title(title, er.rules), er.rules) != er.resolve_title(er.normalize_title(title, er.rules), er.rules):
+			differences += 1
+
+	reference = time_stage(reference_normalize_title, reference_resolve_title, er.rules, titles, args.repeat)
+	current = time_stage(er.normalize_title, er.resolve_title, er.rules, titles, args.repeat)
+
+	print(json.dumps({'titles': len(titles), 'differences': differences,
+					  'reference_us_per_title': reference / len(titles) * 1e6, 'current_us_per_title': current / len(titles) * 1e6,
+					  'speedup': reference / current}, indent=1))
+
+if __name__ == "__main__":
+	main()
@@ -1,514 +1,2182 @@
 #!/usr/bin/env python3
 
 import pandas as pd
+import numpy as np
+import argparse
+import array
+import bz2
+import calendar
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import csv
+import gzip
+import hashlib
+import heapq
+import http.server
+import itertools
 import json
+import lzma
+import math
+import mmap
+import multiprocessing
 import os
+import pickle
+import queue
+import random
 import re
+import shutil
+import socketserver
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
 import time
+import tracemalloc
+import urllib.parse
+import zipfile
+import zlib
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
 
 start_time = time.time()
 
-def main():
+# Alphanumeric words (with at least a digit and a letter) are candidate models
+alphanumeric = re.compile('^(?=.*[0-9])(?=.*[a-z])')
+
+# Brand-specific rewriting of the extracted model (called only if a model has been found)
+
+def fix_canon(model, page_title, brand_rules):
+
+	if model in ['1d', '1ds', '5d', '6d', '7d', 'eos1d', 'g1x']:
+		if ' iv ' in page_title:
+			model = model + ' ' + 'mark4'
+		elif ' iii ' in page_title:
+			model = model + ' ' + 'mark3'
+		elif ' ii ' in page_title or ' markii ' in page_title or ' mkii ' in page_title \
+		or ' mark 2 ' in page_title:
+			if ' ii n ' in page_title:
+				model = model + ' ' + 'mark2n'
+			else:
+				model = model + ' ' + 'mark2'
+		elif ' i ' in page_title:
+			model = model + ' ' + 'mark1'
+	if model.endswith('is'):
+		model = model.replace('is', '')
+	if model.endswith('hs'):
+		model = model.replace('hs', '')
+	if model in brand_rules.mods:
+		model = brand_rules.mods[model]
+	if model.startswith('elph'):
+		model = model.replace('elph', '')
+	if model.startswith('pro'):
+		model = model.replace('pro', '')
+
+	return model
+
+def fix_dahua(model, page_title, brand_rules):
+
+	if model.startswith('ipc'):
+		model = model.replace('ipc', 'dhipc')
+	elif model.startswith('pc'):
+		model = model.replace('pc', 'dhipc')
+	elif model.startswith('hdb'):
+		model = model.replace('hdb', 'dhipchdb')
+	elif model.startswith('hfw'):
+		model = model.replace('hfw', 'dhipchfw')
+	elif model.startswith('sd'):
+		model = model.replace('sd', 'dhsd')
+
+	return model
+
+def fix_leica(model, page_title, brand_rules):
+
+	if model.startswith('lux'):
+		if ' d ' in page_title:
+			model = 'd' + model
+		elif ' v ' in page_title:
+			model = 'v' + model
+		elif ' c ' in page_title:
+			model = 'c' + model
+	if model == '240':
+		if ' p ' in page_title:
+			model = 'mp240'
+		else:
+			model = 'm240'
+
+	return model
+
+def fix_panasonic(model, page_title, brand_rules):
+
+	if model.startswith('dmc'):
+		model = model.replace('dmc', '')
+	if model.endswith('s'):
+		model = model.replace('s', '')
+	if model.endswith('a'):
+		model = model.replace('a', '')
+	if model.endswith('r'):
+		model = model.replace('r', '')
+	if model.endswith('p'):
+		model = model.replace('p', '')
+	if model.endswith('w'):
+		model = model.replace('w', '')
+	if model.endswith('d'):
+		model = model.replace('d', '')
+	if model.endswith('h'):
+		model = model.replace('h', '')
+	if model.endswith('c'):
+		model = model.replace('c', '')
+	if model.endswith('kk'):
+		model = model.replace('kk', '')
+	if model.endswith('k'):
+		model = model.replace('k', '')
+
+	return model
+
+def fix_ricoh(model, page_title, brand_rules):
+
+	if model == 'gr':
+		if ' iv ' in page_title:
+			model = 'gr digital iv'
+		elif ' iii ' in page_title:
+			model = 'gr digital iii'
+		elif ' ii ' in page_title:
+			model = 'gr digital ii'
+		elif ' digital ' in page_title or ' 16mp ' in page_title:
+			model = 'gr digital'
+
+	return model
+
+def fix_sony(model, page_title, brand_rules):
+
+	if model.startswith('dslr'):
+		model = model.replace('dslr', '')
+	elif model.startswith('hx'):
+		model = model.replace('hx', 'dschx')
+	elif model.startswith('ilca'):
+		model = model.replace('ilca', 'a')
+	elif model.startswith('ilcea'):
+		model = model.replace('ilcea', 'a')
+	elif model.startswith('ilce'):
+		model = model.replace('ilce', 'a')
+	elif model.startswith('ice'):
+		model = model.replace('ice', 'a')
+	elif model.startswith('mvc'):
+		model = model.replace('mvc', '')
+	elif model.startswith('p'):
+		model = model.replace('p', 'dscp')
+	elif model.startswith('qx'):
+		model = model.replace('qx', 'dscqx')
+	elif model.startswith('rx'):
+		model = model.replace('rx', 'dscrx')
+	elif model.startswith('slt'):
+		model = model.replace('slt', '')
+	elif model.startswith('tx'):
+		model = model.replace('tx', 'dsctx')
+	elif model.startswith('w'):
+		model = model.replace('w', 'dscw')
+	if model in brand_rules.mods:
+		model = brand_rules.mods[model]
+	if model.endswith('b'):
+		model = model.replace('b', '')
+	elif model.endswith('k'):
+		model = model.replace('k', '')
+	elif model.endswith('l'):
+		model = model.replace('l', '')
+	elif model.endswith('v'):
+		model = model.replace('v', '')
+	elif model.endswith('y'):
+		model = model.replace('y', '')
+	if model == 'a77':
+		if ' ii ' in page_title or ' 2 ' in page_title:
+			model = model + ' ' + '2'
+	if model.startswith('dscrx100'):
+		if ' ii ' in page_title or model in ['dscrx1002', 'dscrx100m2']:
+			model = 'dscrx100' + ' ' + '2'
+		elif ' iii ' in page_title or model in ['dscrx100iii', 'dscrx100m3', 'dscrx100m3b', 'dscrx100miii']:
+			model = 'dscrx100' + ' ' + '3'
+
+	return model
+
+model_fixes = {'canon': fix_canon, 'dahua': fix_dahua, 'leica': fix_leica, 'panasonic': fix_panasonic, 'ricoh': fix_ricoh, 'sony': fix_sony}
+
+class BrandRules:
+
+	# Rules of a single brand, compiled from its entry in the rules file
+	def __init__(self, brand, table):
+		self.brand = brand
+		self.prefixes = frozenset(table.get('prefixes', []))
+		self.suffixes = frozenset(table.get('suffixes', []))
+		self.models = frozenset(table.get('models', [])) # only alphabetic or only numeric models (so not retrieved through regular expressions)
+		self.exceptions = frozenset(table.get('exceptions', [])) # alphanumeric words which do not represent models
+		self.equivalences = table.get('equivalences', {}) # equivalent names for the same model
+		self.mods = table.get('mods', {}) # model names rewritten by the brand-specific model fix
+		self.fix_model = model_fixes.get(brand)
+
+class Rules:
+
+	# Normalization tables and brand rules, compiled once from the rules file
+	def __init__(self, table):
+		# String normalization: punctuation (substituted by space), stop characters (can be inside model name, so just deleted) and aliases
+		self.punctuation = table['punctuation']
+		self.stop_chars = table['stop_chars']
+		self.aliases = table['aliases']
+		self.translation = str.maketrans(dict([(p, ' ') for p in self.punctuation] + [(c, None) for c in self.stop_chars]))
+
+		# Common manufacturers for the brand extraction
+		self.brands = frozenset(table['brands'])
+
+		# Measure suffixes to be ignored for the model extraction
+		self.measures = tuple(table['measures']) # a tuple, so that all suffixes are checked by a single endswith
+
+		# Brands without specific rules share empty ones
+		self.brand_rules = dict((brand, BrandRules(brand, brand_table)) for brand, brand_table in table['brand_rules'].items())
+		self.default_rules = BrandRules('none', {})
+
+def load_rules(path):
+
+	with open(path, 'rb') as data:
+		content = data.read()
+
+	table = json.loads(content)
+	rules = Rules(table)
+	rules.fingerprint = hashlib.sha1(content).hexdigest()
+
+	# Finer fingerprints, to resolve again only what a change of the rules can affect: normalization tables, and the rules of each
+	# brand (measures included, as they are used by the model extraction of every brand)
+	rules.normalization_fingerprint = table_fingerprint([table['punctuation'], table['stop_chars']])
+	rules.brand_fingerprints = dict((brand, table_fingerprint([brand_table, table['measures']])) for brand, brand_table in table['brand_rules'].items())
+	rules.default_fingerprint = table_fingerprint([{}, table['measures']])
+
+	return rules
+
+def table_fingerprint(table):
+
+	return hashlib.sha1(json.dumps(table, sort_keys=True).encode('utf-8')).hexdigest()
+
+def normalize_title(title, rules):
+
+	# String normalization: lowercase, punctuation substituted by space and stop characters deleted (by a single translation table)
+	return title.lower().translate(rules.translation)
+
+def normalize_titles(titles, rules):
+
+	# Batch normalization of a column of raw titles (list, pandas Series or NumPy array), same result as normalize_title on each of them:
+	# every distinct title is normalized once (the string methods of pandas would run the same loop, one title at a time)
+	translation = rules.translation
+	normalized = dict((title, title.lower().translate(translation)) for title in dict.fromkeys(titles))
+
+	return [normalized[title] for title in titles]
+
+def resolve_title(page_title, rules):
+
+	# Resolve a normalized page title into its final form (aliases resolved, prefixes and suffixes attached), brand and model
+	splitted = page_title.split()
+
+	# Resolve aliases and extract brand (no more only among the first 5 words, but in the whole string) in the same pass
+	aliases = rules.aliases
+	brands = rules.brands
+	brand = 'none'
+	for i in range(len(splitted)):
+		s = splitted[i]
+		if s in aliases:
+			s = aliases[s]
+			splitted[i] = s
+		if brand == 'none' and s in brands:
+			brand = s
+
+	# Manage specific elements of the brand
+	brand_rules = rules.brand_rules.get(brand, rules.default_rules)
+
+	# Manage suffixes to make alphanumeric model strings
+	if len(brand_rules.suffixes) > 0:
+		for i in range(1, len(splitted)):
+			if (splitted[i] in brand_rules.suffixes) and (splitted[i - 1].endswith(splitted[i]) == False):
+				splitted[i - 1] = splitted[i - 1] + splitted[i]
+
+	# Manage prefixes to make alphanumeric model strings
+	if len(brand_rules.prefixes) > 0:
+		for i in range(0, len(splitted) - 1):
+			if (splitted[i] in brand_rules.prefixes) and (splitted[i + 1].startswith(splitted[i]) == False):
+				splitted[i] = splitted[i] + splitted[i + 1]
+
+	# Extract model (no more only among the first 5 words, but in the whole string)
+	model = 'none'
+	for s in splitted:
+		if (((s not in brand_rules.exceptions) and (alphanumeric.match(s) is not None)) or (s in brand_rules.models)) and not s.endswith(rules.measures):
+			model = s
+			break
+
+	if model != 'none' and brand_rules.fix_model is not None:
+		model = brand_rules.fix_model(model, page_title, brand_rules)
+
+	if model in brand_rules.equivalences:
+		model = brand_rules.equivalences[model]
+
+	return ' '.join(splitted), brand, model
+
+def code_fingerprint():
+
+	with open(os.path.abspath(__file__), 'rb') as source:
+		return hashlib.sha1(source.read()).hexdigest()
+
+def resolution_version(rules):
+
+	# Persisted resolutions (title cache, state store) are valid only for the rules and the code they were computed with
+	return rules.fingerprint + code_fingerprint()
+
+class TitleCache:
+
+	# Bounded LRU cache of resolve_title results with the given rules, keyed on the normalized page title (size 0 disables it)
+	def __init__(self, size, rules):
+		self.size = size
+		self.rules = rules
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.collect = False # keep the entries resolved since the last call of take_new_entries (to persist them from the main process)
+		self.new_entries = []
+
+	def resolve(self, page_title):
+		if page_title in self.entries:
+			self.hits += 1
+			self.entries.move_to_end(page_title)
+			return self.entries[page_title]
+
+		self.misses += 1
+		result = resolve_title(page_title, self.rules)
+		self.add(page_title, result)
+		if self.collect:
+			self.new_entries.append((page_title, result))
+
+		return result
+
+	def add(self, page_title, result):
+		if self.size > 0:
+			self.entries[page_title] = result
+			self.entries.move_to_end(page_title)
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+	def take_new_entries(self):
+		new_entries = self.new_entries
+		self.new_entries = []
+		return new_entries
+
+	def load(self, path):
+		# A missing or unreadable file (e.g. truncated by an interrupted run) gives an empty cache
+		try:
+			with open(path, 'rb') as data:
+				version, entries = pickle.load(data)
+		except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+			return
+		if version == resolution_version(self.rules):
+			for page_title, result in entries:
+				self.add(page_title, result)
+
+	def save(self, path):
+		# Written aside and then renamed, so that an interrupted run never leaves a partial file
+		with open(path + '.tmp', 'wb') as data:
+			pickle.dump((resolution_version(self.rules), list(self.entries.items())), data, pickle.HIGHEST_PROTOCOL)
+		os.replace(path + '.tmp', path)
+
+# Rules, title cache and reader threads used by read_shard, set up once per process by init_worker
+rules = None
+title_cache = None
+reader_pool = None
+read_ahead_size = 0
+
+def init_worker(rules_path, cache_size, cache_path=None, io_threads=0, read_ahead=0):
+
+	global rules, title_cache, reader_pool, read_ahead_size
+	rules = load_rules(rules_path)
+	title_cache = TitleCache(cache_size, rules)
+	if cache_path is not None:
+		title_cache.load(cache_path)
+		title_cache.collect = True
+	reader_pool = concurrent.futures.ThreadPoolExecutor(io_threads) if io_threads > 0 else None
+	read_ahead_size = max(read_ahead, io_threads)
+
+def parse_title(content):
+
+	# Read the JSON content as a dictionary
+	spec = json.loads(content)
+	spec = dict((k.lower(), v) for k, v in spec.items())
+
+	return spec['<page title>']
+
+def read_content(path, folder_name, file_name):
+
+	with open(path + '/' + str(folder_name) + '/' + str(file_name), 'r') as data:
+		return data.read()
+
+def read_title(path, folder_name, file_name):
+
+	return parse_title(read_content(path, folder_name, file_name))
+
+def read_contents(path, folder_name, file_names, indexes):
+
+	# Contents of the files at the given indexes, in order. Reader threads (if any) read ahead at most read_ahead_size files:
+	# a bounded window, so reading stops while parsing falls behind; without them each file is read when it is needed
+	if reader_pool is None:
+		for i in indexes:
+			yield i, read_content(path, folder_name, file_names[i])
+		return
+
+	pending = collections.deque()
+	for i in indexes:
+		pending.append((i, reader_pool.submit(read_content, path, folder_name, file_names[i])))
+		if len(pending) >= read_ahead_size:
+			i, future = pending.popleft()
+			yield i, future.result()
+	while len(pending) > 0:
+		i, future = pending.popleft()
+		yield i, future.result()
+
+def read_spec(spec_id, page_title):
+
+	camera = {}
+
+	# Add file path as 'id' attribute
+	camera['id'] = spec_id
+
+	# Add 'page_title' attribute (already normalized) resolved into brand and model, keeping the normalized one
+	camera['normalized'] = page_title
+	camera['page_title'], brand, model = title_cache.resolve(page_title)
+	camera['brand'] = brand
+
+	# Mark the current specification as solved if both brand and model have been found
+	if (brand != 'none') and (model != 'none'):
+		camera['brand_n_model'] = brand + ' ' + model
+
+	return camera
+
+class Resolver:
+
+	# Resolution of single titles for other programs (code.py loaded by path, e.g. with importlib): rules are loaded and the title cache
+	# set up once, then each title gives its normalized tokens, brand, model and the cluster it joins (brand_n_model, None if unsolved).
+	# Each resolver has its own rules and cache (not the ones of the pipeline), so resolvers with different rules can coexist
+	def __init__(self, rules_path, cache_size=100000):
+		self.rules = load_rules(rules_path)
+		self.title_cache = TitleCache(cache_size, self.rules)
+
+	def resolve(self, title):
+		return self.result(title, normalize_title(title, self.rules))
+
+	def resolve_many(self, titles):
+		return [self.result(title, page_title) for title, page_title in zip(titles, normalize_titles(titles, self.rules))]
+
+	def result(self, title, page_title):
+		page_title, brand, model = self.title_cache.resolve(page_title)
+		solved = (brand != 'none') and (model != 'none')
 
-	# String normalization: punctuation (substituted by space), stop characters (can be inside model name, so just deleted) and aliases
-	punctuation = [",", ":", ";", "!", "?", "(", ")", "[", "]", "{", "}", "/", "|", '"', "*"]
-	stop_chars = ["-"]
-	aliases = {"cannon": "canon", "canonpowershot": "canon", "eos": "canon", "usedcanon": "canon", "fugi": "fujifilm", "fugifilm": "fujifilm", "fuji": "fujifilm",
-			   "fujufilm": "fujifilm", "general": "ge", "gopros": "gopro", "hikvision3mp": "hikvision", "hikvisionip": "hikvision", "bell+howell": "howell",
-			   "howellwp7": "howell", "minotla": "minolta", "canon&nikon": "nikon", "olympuss": "olympus", "panosonic": "panasonic", "pentax": "ricoh",
-			   "ssamsung": "samsung", "repairsony": "sony", "elf": "elph", "s480016mp": "s4800", "vivicam": "v", "plus": "+", "1080p": "", "720p": ""}
+		return {'title': title, 'page_title': page_title, 'tokens': page_title.split(), 'brand': brand, 'model': model,
+				'cluster': brand + ' ' + model if solved else None}
 
-	# List of common manufacturers for the brand extraction
-	brands = ["aiptek", "apple", "argus", "benq", "canon", "casio", "coleman", "contour", "dahua", "epson", "fujifilm", "garmin", "ge", "gopro", "hasselblad",
-			  "hikvision", "howell", "hp", "intova", "jvc", "kodak", "leica", "lg", "lowepro", "lytro", "minolta", "minox", "motorola", "mustek", "nikon",
-			  "olympus",  "panasonic", "pentax", "philips", "polaroid", "ricoh", "sakar", "samsung", "sanyo", "sekonic", "sigma", "sony", "tamron", "toshiba",
-			  "vivitar", "vtech", "wespro", "yourdeal"]
+PIPELINE_STAGES = ['read', 'parse', 'normalize', 'resolve']
 
-	# List of measure suffixes to be ignored for the model extraction
-	measures = ["cm", "mm", "nm", "inch", "gb", "mb", "mp", "megapixel", "megapixels", "mega", "ghz", "hz", "mah", "cmos", "mps"]
+def read_shard(shard):
 
-	# Read JSON specifications
-	path = 'Dataset/2013_camera_specs'
+	# Resolve a group of specification files of the same source, keeping solved and unsolved specifications apart
+	# (titles, if given, come from a snapshot or an archive: only files whose title is None are read, and their titles are handed back;
+	# archive contents not parsed yet, as bytes, are parsed here)
+	path, folder_name, file_names, titles = shard
 
 	solved_specs = []
 	unsolved_specs = []
+	read_titles = []
+	# Records and seconds of each stage (for read, the time spent waiting for the reader threads)
+	counters = dict((stage, [0, 0.0]) for stage in PIPELINE_STAGES)
 
-	for folder_name in os.listdir(path):
-		for file_name in os.listdir(path + '/' + str(folder_name)):
-			with open(path + '/' + str(folder_name) + '/' + str(file_name), 'r') as data:
-				camera = {}
-
-				# Read the JSON content as a dictionary
-				spec = json.load(data)
-				spec = dict((k.lower(), v) for k, v in spec.items())
-
-				# Add file path as 'id' attribute
-				camera['id'] = str(folder_name) + '//' + str(file_name[:-5])
-
-				# Add and normalize 'page_title' attribute
-				camera['page_title'] = spec['<page title>'].lower()
-				for p in punctuation:
-					camera['page_title'] = camera['page_title'].replace(p, ' ')
-				for c in stop_chars:
-					camera['page_title'] = camera['page_title'].replace(c, '')
-
-				splitted = camera['page_title'].split()
-
-				# Resolve aliases
-				for s in splitted:
-					if s in aliases.keys():
-						index = splitted.index(s)
-						splitted[index] = aliases[s]
-						s = splitted[index]
-
-				# Extract brand (no more only among the first 5 words, but in the whole string)
-				brand = 'none'
-				for s in splitted:
-					if s in brands:
-						brand = s
-						break
-
-				# Manage specific elements of each brand
-				prefixes = []
-				suffixes = []
-				models = [] # only alphabetic or only numeric models (so not retrieved through regular expressions)
-				exceptions = [] # alphanumeric words which do not represent models
-				equivalences = {} # equivalent names for the same model
-
-				if brand == 'aiptek':
-					prefixes = ['dv']
-					exceptions = ['3d']
-				elif brand == 'argus':
-					prefixes = ['dc']
-				elif brand == 'apple':
-					prefixes = ['iphone','quicktake']
-				elif brand == 'canon':
-					prefixes = ['a', 'bg', 'elph', 'hf', 'ixus', 'ixy', 'pro', 'sd', 'sx']
-					suffixes = ['c', 'd', 'ds', 'dx', 'x']
-					models = ['ixusi', 'ixusii', 'xs', 'xsi', 'xt', 'xti']
-					exceptions = ['100v', '1280x', '130ft', '2000s', '3color', '3x', '40m', '4608x', '4colors', '4x', '50x', '5260b009', '5x', '6colors', '70db',
-								  '70dkis', '70dpk', '70dsk', '8160b001', '8231b005', '8595b005', '8x', '9126b003', '9156b001', 'd700', 'ew73b', 'g151428',
-								  'gfb064', 'k47']
-					equivalences = {'600db': '600d', '600dk': '600d', '600dtk': '600d', 'a34000': 'a3400', 'eos1d mark3': '1d mark3', 'eos1dc': '1dc',
-									'eos1dx': '1dx', 'eos40d': '40d', 'eos7d': '7d', 'g1xb': 'g1x', 'g1xc': 'g1x', 's110bk': 's110', 's120bk': 's120',
-									's200bk': 's200', 'sx170isbk': 'sx170', 'sx400isbk': 'sx400', 'sx400isr': 'sx400', 'sx600hsbk': 'sx600', 'sx700hsbk': 'sx700',
-									'sx700hsr': 'sx700'}
-				elif brand == 'casio':
-					prefixes = ['ex', 'qv']
-					models = ['tryx']
-					exceptions = ['2colors', '3x', 'fc150', 'l00ks', 'w0w']
-					equivalences = {'exh10bk': 'exh10', 'exh30bk': 'exh30', 'exs10a': 'exs10', 'exs5pe': 'exs5', 'exs770rd': 'exs770', 'extr15w': 'extr15',
-									'exz80a': 'exz80', 'tr350': 'extr350', 'tr700': 'extr700', 'tryx': 'extr100', 'zr700': 'exzr700'}
-				elif brand == 'coleman':
-					exceptions = ['xtreme2', 'xtreme3']
-					equivalences = {'2v7wpo': '2v7wp', '2v7wpp': '2v7wp'}
-				elif brand == 'contour':
-					prefixes = ['roam']
-				elif brand == 'dahua':
-					exceptions = ['1.3m', '1.3mpl', '100m', '150m', '18x', '2048x1536', '20m', '20x', '30x', '3m', '3x', '50m', '700tvl', 'h.246', 'h.264', 'h264', 'ik10',
-								  'ip66', 'ir100m', 'onvif2.0', 'p2p', 'rs485']
-				elif brand == 'epson':
-					prefixes = ['r', 'rd']
-				elif brand == 'fujifilm':
-					prefixes = ['ax', 'ds', 'hs', 'instax', 'jx', 'mx', 'quicksnap', 'x', 'xpro', 'z']
-					suffixes = ['exr', 'fd']
-					models = ['1300', '2300', '2400', '2600', '2650', '2800', '3800', '4700', '4900']
-					exceptions = ['12x', '2.7in', '3d', '30x', '5in1', '5x', 'casioexg1', 'f550']
-					equivalences = {'fxjx500pink': 'jx500', 'jz250black': 'jz250'}
-				elif brand == 'garmin':
-					suffixes = ['elite']
-					models = ['virb', 'virbelite']
-				elif brand == 'ge':
-					suffixes = ['w']
-					equivalences = {'c1233bk': 'c1233', 'c1440w': 'c1440', 'e1680wbk': 'e1680w', 'x2600w': 'x2600', 'x500bk': 'x500'}
-				elif brand == 'gopro':
-					prefixes = ['hero']
-					suffixes = ['+']
-					exceptions = ['30m', '3d', '45m', '5m', 'h3', 'st29']
-				elif brand == 'hasselblad':
-					prefixes = ['cfv']
-					suffixes = ['40', '50']
-					models = ['lunar', 'stellar']
-				elif brand == 'hikvision':
-					prefixes = ['ds']
-					exceptions = ['100m', '10m', '12v', '20m', '20x', '30m', '32g', '50m', '960p', 'h.246', 'h.264', 'h.624', 'hikvision1080p', 'ip65', 'ip66',
-								  'ir100m', 'ir30m', 'm14', 'no.1', 'rj45', 'rs485']
-					equivalences = {'camerads2cd2032i': 'ds2cd2032i', 'chinads2cd2612fis': 'ds2cd2612fis', 'nds2cd2612fis': 'ds2cd2612fis',
-									'poeds2cd2112i': 'ds2cd2112i'}
-				elif brand == 'howell':
-					prefixes = ['take']
-					exceptions = ['splash2']
-					equivalences = {'dc5r': 'dc5', 'take1hd': 'take1', 'wp10y': 'wp10'}
-				elif brand == 'hp':
-					prefixes = ['r']
-					models = ['215', '315', '318', '320', '435', '618', '635', '720', '735', '812', '850', '935', '945']
-					exceptions = ['8x']
-					equivalences = {'r6074': 'r607'}
-				elif brand == 'intova':
-					prefixes = ['cp', 'ic']
-				elif brand == 'kodak':
-					prefixes = ['cx', 'dc', 'dcs', 'dx', 'kv', 'm']
-					exceptions = ['10x', '3x', '7c55', 'kodakc182bluecolor', 'mpeg4', 'v2.21']
-					equivalences = {'fz41bk': 'fz41'}
-				elif brand == 'leica':
-					prefixes = ['digilux', 'dlux', 'lux', 'vlux', 'x']
-					suffixes = ['p']
-					models = ['112', '114', '240', '701', '9', 'xvario']
-					exceptions = ['0.68x']
-					equivalences = {'9p': 'm9p', 'd6': 'dlux6', 'dluxd3': 'dlux3', 'typ240': 'm240'}
-				elif brand == 'lg':
-					exceptions = ['32in', '3d', 'pn4500']
-				elif brand == 'minolta':
-					prefixes = ['x', 'xg']
-					suffixes = ['si']
-					models = ['5', '7', 'blowout']
-					exceptions = ['3x', 'vc7d']
-				elif brand == 'minox':
-					models = ['dcc', 'dsc', 'minoctar']
-				elif brand == 'motorola':
-					prefixes = ['phone']
-				elif brand == 'mustek':
-					prefixes = ['mdc']
-				elif brand == 'nikon':
-					prefixes = ['aw', 'd', 'l', 's', 'tc', 'v']
-					models = ['25462', '25480', '26286', '2000', '2100', '2200', '2500', '3100', '3200', '3500', '3700', '4200', '4300', '4500', '4600', '4800',
-							  '5000', '5100', '5400', '5600', '5700', '600', '700', '7600', '775', '7900', '800', '8400', '8700', '8800', '885', '950', '990',
-							  '995', 'a', 'df']
-					exceptions = ['10x', '130ft', '2colors', '2pcs', '30x', '3colors', '3d', '3x', '40m', '42x', '4g', '4x', '6x', '7x', 'k164318', 'm130ft',
-								  'nikon1', 's2868', 's3090', 's800bk']
-					equivalences = {'1j2': 'j2', '25462': 'd3000', '25480': 'd800', '26286': 'p7100', 'd1oo': 'd100', 'd32oo': 'd3200', 'd7100lk18': 'd7100',
-									'e3200': '3200', 'e5400': '5400', 'e5600': '5600', 'e8400': '8400', 'e995': '995', 'l610b': 'l610', 's3600sl': 's3600',
-									's6600wh': 's6600', 'so1': 's01', 'so2': 's02'}
-				elif brand == 'olympus':
-					prefixes = ['c', 'd', 'e', 'em', 'ep', 'epm', 'f', 'fe', 'sh', 'sp', 'sz', 't', 'tg', 'vg', 'vh', 'vr', 'x', 'xz']
-					suffixes = ['sw', 'uz']
-					models = ['105', '300', '400', '410', '500', '600', '710', '730', '740', '750', '760', '780', '800', '810', '820', '830', '850', '1000',
-							  '1010', '1040', '1200', '3000', '5010', '6000', '6010', '6020', '7000', '7010', '7030', '7040', '8000', '8010', '9000', '9010']
-					exceptions = ['10.7x', '10x', '1134shot', '15x', '1m', '20x', '26gvy1ozukj', '36x', '3d', '3x', '40m', '50x', '7x', 'dem10', 'dscrx100', 'f2',
-								  'j1', 'v103020bu000', 'x21']
-					equivalences = {'550uz': 'sp550uz', 'emp1': 'epm1', 'tg630ihs': 'tg630', 'tg850ihs': 'tg850', 'tough8000': '8000'}
-				elif brand == 'panasonic':
-					prefixes = ['fs', 'fx', 'hc', 'hx', 'tz']
-					models = ['141', '161', '91']
-					exceptions = ['100v', '10x', '20x', '35x', '3colors', '4colors', '4x', '5x', '60x', '8x']
-					equivalences = {'dmcgh4kbody': 'gh4'}
-				elif brand == 'philips':
-					exceptions = ['3d', '3x']
-					equivalences = {'p44417a': 'p44417', 'p44417b': 'p44417', 'p44417p': 'p44417', 'p44417s': 'p44417', 'p44417w': 'p44417'}
-				elif brand == 'polaroid':
-					prefixes = ['is','pdc']
-					models = ['320', 'pogo']
-					equivalences = {'if045b': 'if045', 'z2300blk': 'z2300'}
-				elif brand == 'ricoh':
-					prefixes = ['i', 'ist', 'k', 'mx', 'q', 'wg', 'x']
-					suffixes = ['ii', 'iis']
-					models = ['30', '60', 'efina', 'gr', 'gxr', 'istd', 'istdl', 'istds', 'km', 'kr', 'kx', 'q+', 'qdigital', 'qrare', 'qwhite', 'theta', 'wgii',
-							  'wgiii']
-					exceptions = ['4x', 'opti0']
-					equivalences = {'km': 'k2000', 'q+': 'q', 'q01': 'q', 'q12': 'q', 'qdigital': 'q', 'qrare': 'q', 'qs102': 'qs1', 'qwhite': 'q',
-									'wg3gps': 'wg3', 'wgii': 'wg2', 'wgiii': 'wg3'}
-				elif brand == 'samsung':
-					prefixes = ['dv', 'mv', 'note', 'pl', 'sh', 'st', 'tl', 'wb']
-					exceptions = ['18x', '20m', '21x', '21x23', '240hz', '26x', '2colors', '3d', '3g', '3x', '4k', '5m', 'camera2', 'case2013', 'ip66']
-					equivalences = {'dv50bk': 'dv50', 'ecdv150f': 'dv150f', 'ecpl120': 'pl120', 'ecpl170': 'pl170', 'ecsh100': 'sh100', 'ecst700': 'st700',
-									'ekgc110zwaxar': 'ekgc110', 'ekgc200zkabtu': 'ekgc200', 'ekgc200zkawtu': 'ekgc200', 'ekgc200zkaxar': 'ekgc200', 'ekgc200zkaxsa': 'ekgc200',
-									'evnx2000bfwca': 'nx2000', 'evnx300zbsvus': 'nx300', 'gc100': 'ekgc100', 'gc110': 'ekgc110', 'gc120': 'ekgc120',
-									'gc120bkv': 'ekgc120', 'gc200': 'ekgc200', 'gc200zwaxar': 'ekgc200', 'hz15wgray': 'hz15w', 'nx2000bfwca': 'nx2000',
-									'sl102pbp': 'sl102', 'un22f5000afxza': 'un22f5000', 'wb110zbarus': 'wb110', 'wb22oof': 'wb2200f', 'wb350.': 'wb350'}
-				elif brand == 'sanyo':
-					prefixes = ['s']
-					exceptions = ['4x', '5x']
-					equivalences = {'s1285w': 's1285', 's770pu': 's770'}
-				elif brand == 'sigma':
-					prefixes = ['f', 'sd']
-					suffixes = ['merrill', 'quattro']
-				elif brand == 'sony':
-					prefixes = ['dsc', 'hdr', 'ilca', 'ilce', 'kdf', 'kdl', 'nex', 'nsx']
-					suffixes = ['tvl']
-					exceptions = ['0whli', '10x', '12x', '130ft', '15m', '16x', '18pcs', '1g', '20m', '24ir', "24led's", '24pcs', '27x', '28x', '2x', "3'sony",
-								  '36x', '3color', '3g', '3x', '4.2v', '40m', '40mbs', '40meter', '42in', '42v', '4x', '500m', '50m', '5x', '63x', '6x', '7075m',
-								  '75m', '7colors', '7fps', '7x', '94mbs', '960h', '960p', 'bullet1', 'bw21', 'bw65', 'cmos1000tvl', 'color1', 'dome1', 'ip66',
-								  'ip66rated', 'ip67', 'ir40m', 'mpeg4', 'onvif2.2', 'p2p', 'price1', 'ps3', 'ry5001c', 'ry7075', 'ry70d1', 'sensor720p',
-								  'sony+dslr+700+michigan', 'sony1', 'sonydscwx5b', 'ss7162', 'top10']
-				elif brand == 'tamron':
-					prefixes = ['f']
-				elif brand == 'toshiba':
-					prefixes = ['pdr']
-				elif brand == 'vivitar':
-					prefixes = ['v']
-					models = ['20', '5118']
-					exceptions = ['10x25', '4x']
-					equivalences = {'20': 'v20', '5118': 'v5118', 'f124': 'vf124', 'f128': 'vf128', 's130': 'vs130', 't027': 'vt027', 't324n': 'vt324',
-									'v5024s': 'v5024', 'vf128pnk': 'vf128', 'vt324n': 'vt324', 'vx014n': 'vx014', 'vx137blk': 'vx137', 'x022': 'vx022',
-									'x137': 'vx137', 'x426': 'vx426'}
-
-				# Manage suffixes to make alphanumeric model strings
-				if len(suffixes) > 0:
-					for i in range(1, len(splitted)):
-						if (splitted[i] in suffixes) and (splitted[i - 1].endswith(splitted[i]) == False):
-							splitted[i - 1] = splitted[i - 1] + splitted[i]
-
-				# Manage prefixes to make alphanumeric model strings
-				if len(prefixes) > 0:
-					for i in range(0, len(splitted) - 1):
-						if (splitted[i] in prefixes) and (splitted[i + 1].startswith(splitted[i]) == False):
-							splitted[i] = splitted[i] + splitted[i + 1]
-
-				# Extract model (no more only among the first 5 words, but in the whole string)
-				model = 'none'
-				for s in splitted:
-					if ((bool(re.match('^(?=.*[0-9])(?=.*[a-z])', s)) == True) and (s not in exceptions)) or (s in models):
-						is_measure = False
-						for m in measures:
-							if s.endswith(m):
-								is_measure = True
-						if is_measure == False:
-							model = s
-							break
-
-				if brand == 'canon' and model != 'none':
-					if model in ['1d', '1ds', '5d', '6d', '7d', 'eos1d', 'g1x']:
-						if ' iv ' in camera['page_title']:
-							model = model + ' ' + 'mark4'
-						elif ' iii ' in camera['page_title']:
-							model = model + ' ' + 'mark3'
-						elif ' ii ' in camera['page_title'] or ' markii ' in camera['page_title'] or ' mkii ' in camera['page_title'] \
-						or ' mark 2 ' in camera['page_title']:
-							if ' ii n ' in camera['page_title']:
-								model = model + ' ' + 'mark2n'
-							else:
-								model = model + ' ' + 'mark2'
-						elif ' i ' in camera['page_title']:
-							model = model + ' ' + 'mark1'
-					mods = {'sl1': '100d', 'x7': '100d', 't1i': '500d', 't1': '500d', 't2i': '550d', 't3': '1100d', 'x50': '1100d', 'ds126291': '1100d',
-							't3i': '600d', '3ti': '600d', 'x5': '600d', 'ds126311': '600d', 't4i': '650d', 't5': '1200d', 't5i': '700d', 'x7i': '700d',
-							'ds126191': '1000d', 'xs': '1000d', 'ds6041': '300d', 'ds126071': '350d', 'xt': '350d', 'ds126151': '400d', 'xti': '400d',
-							'ds126181': '450d', 'xsi': '450d', 'ds126281': '60d', 'ixy120': '135', 'ixy31s': '500', 'ixy610f': '330', 'ixy800': 'sd700',
-							'ixy90': 'sd750', 'ixus100': 'sd780', 'ixus1000': 'sd4500', 'ixus105': 'sd1300', 'ixus110': 'sd960', 'ixus1100': '510',
-							'ixus115': '100', 'ixus120': 'sd940', 'ixus125': '110',	'ixus130': 'sd1400', 'ixus132': '115', 'ixus135': '120', 'ixus140': '130',
-							'ixus145': '135', 'ixus145bk': '135', 'ixus145pr': '135', 'ixus145r': '135', 'ixus150': '140', 'ixus150gy': '140', 'ixus150r': '140',
-							'ixus155': '150', 'ixus155bl': '150', 'ixus155r': '150', 'ixus155s': '150', 'ixus200': 'sd980', 'ixus210': 'sd3500', 'ixus220': '300',
-							'ixus230': '310', 'ixus240': '320', 'ixus255': '330', 'ixus265': '340', 'ixus30': 'sd200', 'ixus300': 'sd4000', 'ixus310': '500',
-							'ixus40': 'sd300', 'ixus400': 's400', 'ixus430': 's410', 'ixus50': 'sd400', 'ixus500': '520', 'ixus510': '530', 'ixus55': 'sd450',
-							'ixus60': 'sd600', 'ixus65': 'sd630', 'ixus70': 'sd1000', 'ixus700': 'sd500', 'ixus75': 'sd750', 'ixus750': 'sd550',
-							'ixus80': 'sd1100', 'ixus800': 'sd700', 'ixus85': 'sd770', 'ixus850': 'sd800', 'ixus860': 'sd870', 'ixus870': 'sd880',
-							'ixus90': 'sd790', 'ixus900': 'sd900', 'ixus95': 'sd1200', 'ixus950': 'sd850', 'ixus960': 'sd950', 'ixus970': 'sd890',
-							'ixus980': 'sd990', 'ixus990': 'sd970', 'ixusi5': 'sd20', 'ixusi7': 'sd40'}
-					if model.endswith('is'):
-						model = model.replace('is', '')
-					if model.endswith('hs'):
-						model = model.replace('hs', '')
-					if model in mods.keys():
-						model = mods[model]
-					if model.startswith('elph'):
-						model = model.replace('elph', '')
-					if model.startswith('pro'):
-						model = model.replace('pro', '')
-
-				if brand == 'dahua' and model != 'none':
-					if model.startswith('ipc'):
-						model = model.replace('ipc', 'dhipc')
-					elif model.startswith('pc'):
-						model = model.replace('pc', 'dhipc')
-					elif model.startswith('hdb'):
-						model = model.replace('hdb', 'dhipchdb')
-					elif model.startswith('hfw'):
-						model = model.replace('hfw', 'dhipchfw')
-					elif model.startswith('sd'):
-						model = model.replace('sd', 'dhsd')
-
-				if brand == 'leica' and model != 'none':
-					if model.startswith('lux'):
-						if ' d ' in camera['page_title']:
-							model = 'd' + model
-						elif ' v ' in camera['page_title']:
-							model = 'v' + model
-						elif ' c ' in camera['page_title']:
-							model = 'c' + model
-					if model == '240':
-						if ' p ' in camera['page_title']:
-							model = 'mp240'
-						else:
-							model = 'm240'
-
-				if brand == 'panasonic' and model != 'none':
-					if model.startswith('dmc'):
-						model = model.replace('dmc', '')
-					if model.endswith('s'):
-						model = model.replace('s', '')
-					if model.endswith('a'):
-						model = model.replace('a', '')
-					if model.endswith('r'):
-						model = model.replace('r', '')
-					if model.endswith('p'):
-						model = model.replace('p', '')
-					if model.endswith('w'):
-						model = model.replace('w', '')
-					if model.endswith('d'):
-						model = model.replace('d', '')
-					if model.endswith('h'):
-						model = model.replace('h', '')
-					if model.endswith('c'):
-						model = model.replace('c', '')
-					if model.endswith('kk'):
-						model = model.replace('kk', '')
-					if model.endswith('k'):
-						model = model.replace('k', '')
-
-				if brand == 'ricoh' and model == 'gr':
-					if ' iv ' in camera['page_title']:
-						model = 'gr digital iv'
-					elif ' iii ' in camera['page_title']:
-						model = 'gr digital iii'
-					elif ' ii ' in camera['page_title']:
-						model = 'gr digital ii'
-					elif ' digital ' in camera['page_title'] or ' 16mp ' in camera['page_title']:
-						model = 'gr digital'
-
-				if brand == 'sony' and model != 'none':
-					if model.startswith('dslr'):
-						model = model.replace('dslr', '')
-					elif model.startswith('hx'):
-						model = model.replace('hx', 'dschx')
-					elif model.startswith('ilca'):
-						model = model.replace('ilca', 'a')
-					elif model.startswith('ilcea'):
-						model = model.replace('ilcea', 'a')
-					elif model.startswith('ilce'):
-						model = model.replace('ilce', 'a')
-					elif model.startswith('ice'):
-						model = model.replace('ice', 'a')
-					elif model.startswith('mvc'):
-						model = model.replace('mvc', '')
-					elif model.startswith('p'):
-						model = model.replace('p', 'dscp')
-					elif model.startswith('qx'):
-						model = model.replace('qx', 'dscqx')
-					elif model.startswith('rx'):
-						model = model.replace('rx', 'dscrx')
-					elif model.startswith('slt'):
-						model = model.replace('slt', '')
-					elif model.startswith('tx'):
-						model = model.replace('tx', 'dsctx')
-					elif model.startswith('w'):
-						model = model.replace('w', 'dscw')
-					mods = {'1200tv': '1200tvl', '300k': 'a300', '350x': 'a350', '420800tvl': '420tvl', '480600tvl': '480tvl', '5n': 'nex5n',
-							'600tvllow': '600tvl', '700tv': '700tvl', '7r': 'a7r', '7s': 'a7s', 'a350x': 'a350', 'a37m': 'a37', 'a55vl': 'a55', 'a58m': 'a58',
-							'a65vk': 'a65', 'a65vl': 'a65', 'a65vm': 'a65', 'a77m2': 'a77 2', 'a77m2q': 'a77 2', 'a77vm': 'a77', 'cd400kitis' : 'cd400',
-							'dsch7megamovie': 'dsch7', 'dschx400vb': 'dschx400', 'dschx50vb': 'dschx50', 'dschx60vb': 'dschx60', 'dscp93a': 'dscp93',
-							'dscrx100m': 'dscrx100', 'dsct300r': 'dsct300', 'dscw120p': 'dscw120', 'dscw120digital': 'dscw120', 'dscw150r': 'dscw150',
-							'dscw1digital': 'dscw1', 'dscw350d': 'dscw350', 'dscw710p': 'dscw710', 'dscw810s': 'dscw810', 'dscw830s': 'dscw830',
-							'dscwx350w': 'dscwx350', 'f707': 'dscf707',	'f828': 'dscf828', 'h10': 'dsch10', 'h20': 'dsch20', 'h200': 'dsch200', 'h400': 'dsch400',
-							'h50': 'dsch50', 'h90': 'dsch90', 'hdras100vr': 'hdras100', 'hdrpj240er': 'hdrpj240e', 'hdrpj240es': 'hdrpj240e',
-							'hdrpj340ew': 'hdrpj340e', 'nex3kb': 'nex3', 'nex3nbmbdl': 'nex3n', 'nex567': 'nex5', 'nex5c': 'nex5', 'nex5ndslr': 'nex5n',
-							'nex5rkb': 'nex5r', 'nex5tls': 'nex5t',	'nex6lb2bdl': 'nex6', 'nex6lb': 'nex6', 's2100': 'dscs2100', 's50': 'dscs50',
-							's650': 'dscs650', 's70': 'dscs70', 's85': 'dscs85', 'slta55': 'a55', 'stla99v': 'a99', 't300': 'dsct300', 't90': 'dsct90',
-							't99': 'dsct99'}
-					if model in mods.keys():
-						model = mods[model]
-					if model.endswith('b'):
-						model = model.replace('b', '')
-					elif model.endswith('k'):
-						model = model.replace('k', '')
-					elif model.endswith('l'):
-						model = model.replace('l', '')
-					elif model.endswith('v'):
-						model = model.replace('v', '')
-					elif model.endswith('y'):
-						model = model.replace('y', '')
-					if model == 'a77':
-						if ' ii ' in camera['page_title'] or ' 2 ' in camera['page_title']:
-							model = model + ' ' + '2'
-					if model.startswith('dscrx100'):
-						if ' ii ' in camera['page_title'] or model in ['dscrx1002', 'dscrx100m2']:
-							model = 'dscrx100' + ' ' + '2'
-						elif ' iii ' in camera['page_title'] or model in ['dscrx100iii', 'dscrx100m3', 'dscrx100m3b', 'dscrx100miii']:
-							model = 'dscrx100' + ' ' + '3'
-
-				if model in equivalences.keys():
-						model = equivalences[model]
-
-				camera['page_title'] = ' '.join(splitted)
-
-				# Put the current specification in the right group (solved or unsolved)
-				if (brand != 'none') and (model != 'none'):
-					camera['brand_n_model'] = brand + ' ' + model
-					solved_specs.append(camera)
-				else:
-					unsolved_specs.append(camera)
+	# All the titles of the shard are read and parsed first, then normalized as a batch and resolved
+	raw_titles = list(titles) if titles is not None else [None] * len(file_names)
+	start = time.perf_counter()
+	for i in range(len(raw_titles)):
+		if isinstance(raw_titles[i], bytes):
+			raw_titles[i] = parse_title(raw_titles[i])
+			counters['parse'][0] += 1
+	counters['parse'][1] += time.perf_counter() - start
+	contents = read_contents(path, folder_name, file_names, [i for i in range(len(file_names)) if raw_titles[i] is None])
+	while True:
+		start = time.perf_counter()
+		i, content = next(contents, (None, None))
+		if i is None:
+			break
+		parse_start = time.perf_counter()
+		raw_titles[i] = parse_title(content)
+		if titles is not None:
+			read_titles.append((i, raw_titles[i]))
+		counters['read'][0] += 1
+		counters['read'][1] += parse_start - start
+		counters['parse'][0] += 1
+		counters['parse'][1] += time.perf_counter() - parse_start
 
-	mid_time = time.time()
-	print(mid_time - start_time)
+	start = time.perf_counter()
+	page_titles = normalize_titles(raw_titles, rules)
+	counters['normalize'] = [len(page_titles), time.perf_counter() - start]
+
+	start = time.perf_counter()
+	for i in range(len(file_names)):
+		camera = read_spec(str(folder_name) + '//' + str(file_names[i][:-5]), page_titles[i])
+		if 'brand_n_model' in camera:
+			solved_specs.append(camera)
+		else:
+			unsolved_specs.append(camera)
+	counters['resolve'] = [len(file_names), time.perf_counter() - start]
+
+	# Cache statistics, stage counters and newly resolved titles of this shard are handed back to the main process
+	hits, misses = title_cache.hits, title_cache.misses
+	title_cache.hits, title_cache.misses = 0, 0
+
+	return solved_specs, unsolved_specs, (hits, misses), counters, title_cache.take_new_entries(), read_titles
+
+def open_compressed(path):
+
+	# Binary stream of a file, decompressed if it is gzip, bzip2 or xz compressed (told by its first bytes)
+	with open(path, 'rb') as data:
+		magic = data.read(6)
+	if magic.startswith(b'\x1f\x8b'):
+		return gzip.open(path, 'rb')
+	if magic.startswith(b'BZh'):
+		return bz2.open(path, 'rb')
+	if magic.startswith(b'\xfd7zXZ\x00'):
+		return lzma.open(path, 'rb')
+	return open(path, 'rb')
+
+def tar_number(field):
+
+	# Numeric field of a tar header: octal digits, or big-endian binary if the first bit is set
+	if field[0] & 0x80:
+		return int.from_bytes(field[1:], 'big')
+	field = field.split(b'\0', 1)[0].strip()
+	return int(field, 8) if len(field) > 0 else 0
+
+def tar_members(path):
 
-	print(len(solved_specs))
-	print(len(unsolved_specs))
+	# (name, modification time, content) of every regular file of a tar archive (possibly compressed), read sequentially.
+	# Headers are decoded here rather than by tarfile, which spends most of the time of a dataset of small files on them: ustar
+	# names with prefix, GNU long names and pax paths and modification times are supported, other entries are skipped
+	with open_compressed(path) as stream:
+		long_name = None
+		pax = {}
+		while True:
+			header = stream.read(512)
+			if len(header) < 512 or header == bytes(512):
+				return
+			# Checksum: sum of the header bytes, counting its own field as spaces
+			try:
+				checksum = tar_number(header[148:156])
+			except ValueError:
+				checksum = None
+			if sum(header[:148]) + 8 * 32 + sum(header[156:]) != checksum:
+				raise ValueError(path + ' is not a tar archive')
+			size = tar_number(header[124:136])
+			content = stream.read(size)
+			stream.read(-size % 512)
 
-#	solved_specs_df = pd.DataFrame(solved_specs)
-#	solved_specs_df.set_index('id')
+			kind = header[156:157]
+			if kind == b'L':
+				long_name = content.split(b'\0', 1)[0].decode('utf-8')
+			elif kind == b'x':
+				# Records "length key=value\n"
+				pax = {}
+				while len(content) > 0:
+					length = int(content.split(b' ', 1)[0])
+					key, value = content[:length - 1].split(b' ', 1)[1].split(b'=', 1)
+					pax[key.decode('utf-8')] = value.decode('utf-8')
+					content = content[length:]
+			elif kind != b'g':
+				name = header[0:100].split(b'\0', 1)[0].decode('utf-8')
+				if header[257:262] == b'ustar' and header[345] != 0:
+					name = header[345:500].split(b'\0', 1)[0].decode('utf-8') + '/' + name
+				name = pax.get('path', long_name if long_name is not None else name)
+				mtime = int(float(pax['mtime'])) if 'mtime' in pax else tar_number(header[136:148])
+				long_name = None
+				pax = {}
+				if kind in (b'0', b'\0', b'7'):
+					yield name, mtime, content
 
-#	unsolved_specs_df = pd.DataFrame(unsolved_specs)
-#	unsolved_specs_df.set_index('id')
+def archive_entries(path):
 
-#	solved_specs_df = solved_specs_df.sort_values(by=['brand_n_model'])
-#	solved_specs_df.to_csv('solved_specs.csv', index=False)
-#	unsolved_specs_df.to_csv('unsolved_specs.csv', index=False)
+	# Specifications of an archive, read sequentially: (source, file name, content, modification time, size) for every JSON file
+	# of a tar (possibly compressed) or zip archive of the dataset folder, with the content left unparsed (bytes), or for every line
+	# of a JSON-lines bundle (possibly gzipped) whose objects carry their id ("source//file") in "spec_id" besides the attributes of
+	# the specification, with the title as content (the line has to be parsed for its id anyway)
+	if path.endswith(('.jsonl', '.jsonl.gz')):
+		with (gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, 'r', encoding='utf-8')) as bundle:
+			for line in bundle:
+				if line.strip() != '':
+					spec = json.loads(line)
+					folder_name, stem = spec.pop('spec_id').split('//', 1)
+					spec = dict((k.lower(), v) for k, v in spec.items())
+					# Lines have no modification time: changes are found by their length
+					yield folder_name, stem + '.json', spec['<page title>'], 0, len(line)
+	elif zipfile.is_zipfile(path):
+		with zipfile.ZipFile(path) as archive:
+			for info in archive.infolist():
+				parts = info.filename.split('/')
+				if not info.is_dir() and len(parts) > 1 and parts[-1].endswith('.json'):
+					yield parts[-2], parts[-1], archive.read(info), calendar.timegm(info.date_time + (0, 0, 0)) * 10 ** 9, info.file_size
+	else:
+		for name, mtime, content in tar_members(path):
+			parts = name.split('/')
+			if len(parts) > 1 and parts[-1].endswith('.json'):
+				yield parts[-2], parts[-1], content, mtime * 10 ** 9, len(content)
 
-	# Get matches from solved specifications
+def archive_shards(path, shard_size, stats):
 
-	clusters = dict()
+	# Shards of an archive, yielded while it is read (in its own order, consecutive files of the same source together): every shard
+	# carries the contents of its files, parsed by the workers, and its stats are appended to stats as it is yielded
+	for folder_name, entries in itertools.groupby(archive_entries(path), key=lambda e: e[0]):
+		while True:
+			chunk = list(itertools.islice(entries, shard_size))
+			if len(chunk) == 0:
+				break
+			stats.append(dict((str(folder_name) + '//' + str(e[1][:-5]), e[3:]) for e in chunk))
+			yield path, folder_name, [e[1] for e in chunk], [e[2] for e in chunk]
 
-	for s in solved_specs:
-		if s['brand_n_model'] in clusters.keys():
-			clusters[s['brand_n_model']].append(s['id'])
+def make_shards(path, shard_size, snapshot=None, with_stats=False):
+
+	# Split the file list of each source into groups of at most shard_size files (sorted, so that the order never depends on the file system)
+	# With a snapshot (or if asked), files are listed with modification time and size (by id, in file order), and unchanged files get their
+	# title from the snapshot
+	shards = []
+	stats = []
+
+	# An archive is read once, as shards are consumed: shards are then a generator, and stats grow with it
+	if os.path.isfile(path):
+		return archive_shards(path, shard_size, stats), stats
+
+	for folder_name in sorted(os.listdir(path)):
+		if snapshot is None and not with_stats:
+			file_names = sorted(os.listdir(path + '/' + str(folder_name)))
+			for i in range(0, len(file_names), shard_size):
+				shards.append((path, folder_name, file_names[i:i + shard_size], None))
 		else:
-			clusters.update({s['brand_n_model'] : [s['id']]})
+			entries = sorted((e.name, stat.st_mtime_ns, stat.st_size) for e in os.scandir(path + '/' + str(folder_name)) for stat in [e.stat()])
+			file_names = [e[0] for e in entries]
+			spec_ids = [str(folder_name) + '//' + name[:-5] for name in file_names]
+			file_stats = [e[1:] for e in entries]
+			if snapshot is not None:
+				titles = snapshot.titles(spec_ids, file_stats)
+			for i in range(0, len(entries), shard_size):
+				shards.append((path, folder_name, file_names[i:i + shard_size], titles[i:i + shard_size] if snapshot is not None else None))
+				stats.append(dict(zip(spec_ids[i:i + shard_size], file_stats[i:i + shard_size])))
+
+	return shards, stats
+
+# Snapshot file layout: header (magic, number of specifications, sizes of the id and title buffers), offsets of ids in the id buffer
+# and of titles in the title buffer, modification times and sizes of the files (all int64), then the id buffer (UTF-8 ids, one after
+# the other, in the order the files are listed) and the title buffer (UTF-8 raw titles, same order)
+SNAPSHOT_MAGIC = b'CAMSNAP2'
+SNAPSHOT_HEADER = struct.Struct('<8sQQQ')
+
+class Snapshot:
+
+	# Read-only view of a snapshot file, mapped in memory: titles are decoded only when looked up. Snapshots of an older layout,
+	# and files too short for their header and arrays (e.g. left by an interrupted copy), are taken as empty (they are rewritten by the run)
+	def __init__(self, path):
+		self.size = 0
+		self.position = 0
+		self.index = None
+		if not os.path.exists(path) or os.path.getsize(path) < SNAPSHOT_HEADER.size:
+			return
+
+		with open(path, 'rb') as data:
+			self.map = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, size, ids_size, titles_size = SNAPSHOT_HEADER.unpack_from(self.map, 0)
+		if magic != SNAPSHOT_MAGIC:
+			if magic.startswith(SNAPSHOT_MAGIC[:-1]):
+				return
+			raise ValueError(path + ' is not a snapshot file')
+		if len(self.map) < SNAPSHOT_HEADER.size + 8 * (4 * size + 2) + ids_size + titles_size:
+			return
+
+		self.size = size
+		start = SNAPSHOT_HEADER.size
+		self.id_offsets = np.frombuffer(self.map, dtype='<i8', count=self.size + 1, offset=start)
+		start += 8 * (self.size + 1)
+		self.title_offsets = np.frombuffer(self.map, dtype='<i8', count=self.size + 1, offset=start)
+		start += 8 * (self.size + 1)
+		self.mtimes = np.frombuffer(self.map, dtype='<i8', count=self.size, offset=start)
+		start += 8 * self.size
+		self.sizes = np.frombuffer(self.map, dtype='<i8', count=self.size, offset=start)
+		start += 8 * self.size
+		self.ids_start = start
+		self.titles_start = start + ids_size
+
+	def spec_id(self, i):
+		return self.map[self.ids_start + self.id_offsets[i]:self.ids_start + self.id_offsets[i + 1]]
+
+	def title(self, i):
+		return self.map[self.titles_start + self.title_offsets[i]:self.titles_start + self.title_offsets[i + 1]].decode('utf-8')
 
-	couples = set()
-	for c in clusters.keys():
-		if len(clusters[c]) > 1:
-			for i in clusters[c]:
-				for j in clusters[c]:
-					if i < j:
-						couples.add((i, j))
-					if i > j:
-						couples.add((j, i))
+	def titles(self, spec_ids, file_stats):
+		# Titles of the unchanged files of a source, given the ids and the (modification time, size) of its files in sorted order;
+		# None for new or changed files
+		spec_ids = [spec_id.encode('utf-8') for spec_id in spec_ids]
+		file_stats = np.array(file_stats, dtype=np.int64).reshape(-1, 2)
+		mtimes, sizes = file_stats[:, 0], file_stats[:, 1]
 
-	couples = list(couples)
-	couples = pd.DataFrame(couples, columns = ['left_spec_id', 'right_spec_id'])
+		# Sources are listed in the order they were saved: as long as no file is added or deleted, the ids of a source are the next ones
+		# of the snapshot, and the whole listing is compared at once (ids as a single buffer, times and sizes as arrays)
+		start = self.position
+		end = start + len(spec_ids)
+		if self.index is None and end <= self.size:
+			lengths = np.fromiter((len(spec_id) for spec_id in spec_ids), dtype=np.int64, count=len(spec_ids))
+			if np.array_equal(np.diff(self.id_offsets[start:end + 1]), lengths) and \
+			   self.map[self.ids_start + self.id_offsets[start]:self.ids_start + self.id_offsets[end]] == b''.join(spec_ids):
+				self.position = end
+				unchanged = ((self.mtimes[start:end] == mtimes) & (self.sizes[start:end] == sizes)).tolist()
+				offsets = (self.title_offsets[start:end + 1] - self.title_offsets[start]).tolist()
+				buffer = self.map[self.titles_start + self.title_offsets[start]:self.titles_start + self.title_offsets[end]]
+				return [buffer[offsets[k]:offsets[k + 1]].decode('utf-8') if unchanged[k] else None for k in range(len(spec_ids))]
 
-	print(couples)
+		# Otherwise files are looked up one by one in an index of the whole snapshot (ids kept as bytes), built the first time
+		if self.index is None:
+			self.index = dict((self.spec_id(i), i) for i in range(self.size))
+		titles = []
+		for k, spec_id in enumerate(spec_ids):
+			i = self.index.get(spec_id)
+			titles.append(self.title(i) if i is not None and self.mtimes[i] == mtimes[k] and self.sizes[i] == sizes[k] else None)
+		return titles
 
-	# Find identical strings in unsolved specifications
+class SnapshotWriter:
 
-	clusters = dict()
+	def __init__(self):
+		self.id_offsets = array.array('q', [0])
+		self.title_offsets = array.array('q', [0])
+		self.mtimes = array.array('q')
+		self.sizes = array.array('q')
+		self.ids = bytearray()
+		self.titles = bytearray()
 
-	for u in unsolved_specs:
-		if u['page_title'] in clusters.keys():
-			clusters[u['page_title']].append(u['id'])
+	def add(self, spec_id, title, mtime, size):
+		self.ids += spec_id.encode('utf-8')
+		self.id_offsets.append(len(self.ids))
+		self.titles += title.encode('utf-8')
+		self.title_offsets.append(len(self.titles))
+		self.mtimes.append(mtime)
+		self.sizes.append(size)
+
+	def save(self, path):
+		# Written aside and then renamed, so that a snapshot being mapped is never modified
+		with open(path + '.tmp', 'wb') as data:
+			data.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(self.mtimes), len(self.ids), len(self.titles)))
+			for values in (self.id_offsets, self.title_offsets, self.mtimes, self.sizes):
+				if sys.byteorder != 'little':
+					values = array.array('q', values)
+					values.byteswap()
+				data.write(values.tobytes())
+			data.write(self.ids)
+			data.write(self.titles)
+		os.replace(path + '.tmp', path)
+
+class Interner:
+
+	# Table of distinct strings, each identified by an integer code (the position of its first occurrence)
+	def __init__(self):
+		self.codes = {}
+		self.strings = []
+
+	def code(self, string):
+		code = self.codes.get(string)
+		if code is None:
+			code = len(self.strings)
+			self.codes[string] = code
+			self.strings.append(string)
+		return code
+
+class PackedStrings:
+
+	# Table of distinct strings packed in a single UTF-8 buffer with an array of offsets (decoded only when accessed), each identified
+	# by an integer code like in Interner. Strings are found again through a map from their hash to their code (strings with the same
+	# hash but different contents, if any, are kept apart), so that no string object is kept; freeze drops the map once the table is
+	# complete and turns the offsets into a NumPy array
+	def __init__(self):
+		self.buffer = bytearray()
+		self.offsets = array.array('q', [0])
+		self.codes = {}
+		self.collisions = {}
+
+	def code(self, string):
+		encoded = string.encode('utf-8')
+		key = hash(encoded)
+		code = self.codes.get(key)
+		if code is None:
+			code = self.append(encoded)
+			self.codes[key] = code
+			return code
+		if self.buffer[self.offsets[code]:self.offsets[code + 1]] == encoded:
+			return code
+		code = self.collisions.get(encoded)
+		if code is None:
+			code = self.append(encoded)
+			self.collisions[encoded] = code
+		return code
+
+	def append(self, encoded):
+		self.buffer += encoded
+		self.offsets.append(len(self.buffer))
+		return len(self.offsets) - 2
+
+	def freeze(self):
+		self.codes = None
+		self.collisions = None
+		self.offsets = np.frombuffer(self.offsets, dtype=np.int64)
+
+	def __getitem__(self, code):
+		return self.buffer[self.offsets[code]:self.offsets[code + 1]].decode('utf-8')
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+class SpecStore:
+
+	# Compact columnar store of resolved specifications. Sources, page titles, labels (brand and model) and brands are interned into
+	# integer codes; ids are kept as (source code, file number), file names not made of a plain number being interned as well.
+	# Titles, the only column with nearly one distinct value per record, are interned straight into a packed buffer.
+	# Records are appended to compact arrays, turned into NumPy arrays by freeze
+	def __init__(self, with_stats=False):
+		self.sources = Interner()
+		self.stems = Interner()
+		self.titles = PackedStrings()
+		self.labels = Interner()
+		self.brands = Interner()
+		self.normalized = Interner()
+		self.columns = dict((name, array.array('q' if name in ('file', 'mtime', 'size') else 'i'))
+							for name in (['source', 'file', 'title', 'label', 'brand'] + (['mtime', 'size', 'normalized'] if with_stats else [])))
+
+	def add(self, camera, stats=None):
+		source, stem = camera['id'].split('//', 1)
+		self.columns['source'].append(self.sources.code(source))
+		# Plain numbers (the file names of the dataset) are stored as they are if they fit in the column, other names as negative codes
+		if stem.isascii() and stem.isdigit() and len(stem) <= 18 and str(int(stem)) == stem:
+			self.columns['file'].append(int(stem))
 		else:
-			clusters.update({u['page_title'] : [u['id']]})
+			self.columns['file'].append(-1 - self.stems.code(stem))
+		self.columns['title'].append(self.titles.code(camera['page_title']))
+		self.columns['label'].append(self.labels.code(camera['brand_n_model']) if 'brand_n_model' in camera else -1)
+		self.columns['brand'].append(self.brands.code(camera['brand']))
+		if stats is not None:
+			self.columns['mtime'].append(stats[0])
+			self.columns['size'].append(stats[1])
+			self.columns['normalized'].append(self.normalized.code(camera['normalized']))
+
+	def freeze(self):
+		self.columns = dict((name, np.frombuffer(column, dtype=np.int64 if column.typecode == 'q' else np.int32)) for name, column in self.columns.items())
+		self.titles.freeze()
+		self.solved = self.columns['label'] >= 0
+
+	def __len__(self):
+		return len(self.columns['source'])
+
+	def spec_id(self, i):
+		file = int(self.columns['file'][i])
+		return self.sources.strings[self.columns['source'][i]] + '//' + (str(file) if file >= 0 else self.stems.strings[-1 - file])
+
+	def groups(self, by, solved):
+		# Record indexes of solved (or unsolved, or with solved None all) specifications grouped by label or title code, through
+		# a stable argsort: the codes of the groups, their start and end in the sorted indexes, and the sorted indexes
+		selected = np.arange(len(self)) if solved is None else np.flatnonzero(self.solved if solved else ~self.solved)
+		codes = self.columns[by][selected]
+		order = np.argsort(codes, kind='stable')
+		codes = codes[order]
+		bounds = np.flatnonzero(np.diff(codes)) + 1
+		starts = np.concatenate(([0], bounds)).astype(np.int64)
+		ends = np.concatenate((bounds, [len(codes)])).astype(np.int64)
+
+		return codes[starts] if len(codes) > 0 else codes, starts, ends, selected[order]
+
+	def table(self, by):
+		return self.labels.strings if by == 'label' else self.titles
+
+	def clusters(self, by, solved, min_size=2):
+		# (key, ids) of every group with at least min_size specifications; ids are built one cluster at a time. Labels come in key
+		# order (hence brand by brand), titles in code order (their first occurrence), so that no title is decoded but the ones yielded
+		codes, starts, ends, members = self.groups(by, solved)
+		table = self.table(by)
+		order = sorted(range(len(codes)), key=lambda k: table[codes[k]]) if by == 'label' else range(len(codes))
+
+		for k in order:
+			if ends[k] - starts[k] >= min_size:
+				yield table[codes[k]], [self.spec_id(i) for i in members[starts[k]:ends[k]]]
+
+	def cluster_sizes(self, by, solved):
+		# (key, size) of every group
+		codes, starts, ends, members = self.groups(by, solved)
+		table = self.table(by)
+
+		return [(table[codes[k]], int(ends[k] - starts[k])) for k in range(len(codes))]
+
+	def state_rows(self):
+		# Rows of the state store: id, modification time and size of the file, cluster, normalized title and brand
+		for i in range(len(self)):
+			if self.solved[i]:
+				cluster = 1, self.labels.strings[self.columns['label'][i]]
+			else:
+				cluster = 0, self.titles[self.columns['title'][i]]
+			yield ((self.spec_id(i), int(self.columns['mtime'][i]), int(self.columns['size'][i])) + cluster +
+				   (self.normalized.strings[self.columns['normalized'][i]], self.brands.strings[self.columns['brand'][i]]))
+
+class DisjointSet:
+
+	# Union-find over the integers from 0 to size - 1 (union by size, path halving)
+	def __init__(self, size):
+		self.parent = list(range(size))
+		self.sizes = [1] * size
+
+	def find(self, x):
+		parent = self.parent
+		while parent[x] != x:
+			parent[x] = parent[parent[x]]
+			x = parent[x]
+		return x
+
+	def union(self, x, y):
+		x = self.find(x)
+		y = self.find(y)
+		if x != y:
+			if self.sizes[x] < self.sizes[y]:
+				x, y = y, x
+			self.parent[y] = x
+			self.sizes[x] += self.sizes[y]
+
+	def union_groups(self, starts, ends, members):
+		# Join the members of each group (as given by SpecStore.groups)
+		for k in range(len(starts)):
+			for m in members[starts[k] + 1:ends[k]]:
+				self.union(members[starts[k]], m)
+
+def transitive_clusters(store, groups=None, similar=None):
+
+	# Entities: transitive closure of all the matches, over the record indexes of the store. Specifications are joined when they
+	# have the same brand and model, or the same title (unsolved ones with each other and with solved ones: identical titles have
+	# identical resolutions), and, if given, when their groups (title, solved, ids) are pairs of similar titles.
+	# Entities are numbered by their smallest id and given as (entity, ids) in this order
+	entities = DisjointSet(len(store))
+	codes, starts, ends, members = store.groups('label', True)
+	entities.union_groups(starts.tolist(), ends.tolist(), members.tolist())
+	codes, starts, ends, members = store.groups('title', None)
+	starts, ends, members = starts.tolist(), ends.tolist(), members.tolist()
+	entities.union_groups(starts, ends, members)
+
+	if similar is not None:
+		# Any specification with the title of a group stands for the whole group, already joined
+		record_of_title = dict((store.titles[codes[k]], members[starts[k]]) for k in range(len(codes)))
+		for a, b in similar:
+			entities.union(record_of_title[groups[a][0]], record_of_title[groups[b][0]])
+
+	ids = [store.spec_id(i) for i in range(len(store))]
+	numbers = {}
+	clusters = []
+	for i in sorted(range(len(store)), key=ids.__getitem__):
+		root = entities.find(i)
+		if root not in numbers:
+			numbers[root] = len(clusters)
+			clusters.append((numbers[root], []))
+		clusters[numbers[root]][1].append(ids[i])
+
+	return clusters
+
+# Size of the output file buffer: pairs reach the disk in chunks of this size
+OUTPUT_BUFFER = 1 << 20
+
+def open_output(path, format='pairs'):
+
+	# Output file: Parquet for pairs in columns, gzipped text if its name ends with .gz, plain text otherwise
+	if format == 'parquet':
+		return ParquetPairs(path)
+	if path.endswith('.gz'):
+		return gzip.open(path, 'wt', compresslevel=6, newline='')
+	return open(path, 'w', buffering=OUTPUT_BUFFER, newline='')
+
+def pair_writer(matches):
+
+	# Pairs go to a CSV writer on a text file, or straight to any object with writerows (PairSorter, ParquetPairs)
+	return matches if hasattr(matches, 'writerows') else csv.writer(matches, lineterminator='\n')
+
+class ParquetPairs:
+
+	# Pairs written as a Parquet file with two string columns (dictionary encoded, zstd compressed), a row group at a time
+	def __init__(self, path, rows=1 << 20):
+		schema = pyarrow.schema([('left_spec_id', pyarrow.string()), ('right_spec_id', pyarrow.string())])
+		self.writer = pyarrow.parquet.ParquetWriter(path, schema, compression='zstd', use_dictionary=True)
+		self.rows = rows
+		self.left = []
+		self.right = []
+
+	def writerows(self, pairs):
+		for left, right in pairs:
+			self.left.append(left)
+			self.right.append(right)
+			if len(self.left) >= self.rows:
+				self.flush()
+
+	def flush(self):
+		if len(self.left) > 0:
+			self.writer.write_table(pyarrow.table({'left_spec_id': self.left, 'right_spec_id': self.right}, schema=self.writer.schema))
+			self.left = []
+			self.right = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception):
+		self.flush()
+		self.writer.close()
+
+class PairSorter:
+
+	# Pairs written in (left, right) order whatever the order they come in, without duplicates, in bounded memory: pairs are kept
+	# in memory up to budget bytes, then sorted and spilled as a run to a temporary file; runs are merged when the sorter is closed
+	PAIR_BYTES = 64 # a buffered pair is a tuple of two id strings already in memory
+	MERGE_RUNS = 64
+
+	def __init__(self, writer, budget, folder):
+		self.writer = writer
+		self.capacity = max(budget // self.PAIR_BYTES, 1)
+		self.buffer = []
+		self.folder = tempfile.mkdtemp(prefix='pairs-', dir=folder)
+		self.runs = []
+		self.duplicates = 0
+
+	def writerows(self, pairs):
+		pairs = iter(pairs)
+		while True:
+			count = len(self.buffer)
+			self.buffer.extend(itertools.islice(pairs, self.capacity - count))
+			if len(self.buffer) < self.capacity:
+				break
+			self.spill()
+
+	def spill(self):
+		self.buffer.sort()
+		self.runs.append(os.path.join(self.folder, 'run-%05d.csv' % len(self.runs)))
+		with open(self.runs[-1], 'w', buffering=OUTPUT_BUFFER, newline='') as run:
+			csv.writer(run, lineterminator='\n').writerows(self.buffer)
+		self.buffer = []
+
+	def merge(self, runs, buffer, writer):
+		# Write to writer the pairs of some runs and of a sorted buffer, in order and without duplicates
+		files = [open(run, 'r', buffering=OUTPUT_BUFFER, newline='') for run in runs]
+		try:
+			previous = None
+			for pair in heapq.merge(buffer, *(map(tuple, csv.reader(run)) for run in files)):
+				if pair == previous:
+					self.duplicates += 1
+					continue
+				writer.writerows((pair,))
+				previous = pair
+		finally:
+			for run in files:
+				run.close()
+
+	def close(self):
+		try:
+			# Runs are merged at most MERGE_RUNS at a time (open files are limited), into longer runs, until few enough remain
+			merged = 0
+			pending = list(self.runs)
+			while len(pending) > self.MERGE_RUNS:
+				run = os.path.join(self.folder, 'merged-%05d.csv' % merged)
+				merged += 1
+				with open(run, 'w', buffering=OUTPUT_BUFFER, newline='') as output:
+					self.merge(pending[:self.MERGE_RUNS], [], csv.writer(output, lineterminator='\n'))
+				for done in pending[:self.MERGE_RUNS]:
+					os.remove(done)
+				pending = pending[self.MERGE_RUNS:] + [run]
+
+			self.buffer.sort()
+			self.merge(pending, self.buffer, self.writer)
+		finally:
+			shutil.rmtree(self.folder)
+		self.buffer = []
+
+def cluster_pairs(c, ids, max_pairs=None, sample=False, truncated=None):
+
+	# Unordered pairs of a cluster, in order. Beyond max_pairs pairs, only the first max_pairs are given or, with sample, a uniform
+	# sample of them (the same at every run), and the cluster is added to truncated
+	ids = sorted(ids)
+	total = len(ids) * (len(ids) - 1) // 2
+	if max_pairs is None or total <= max_pairs:
+		return itertools.combinations(ids, 2), total
+
+	if truncated is not None:
+		truncated.append({'cluster': c, 'size': len(ids), 'pairs': total, 'written': max_pairs})
+	if not sample:
+		return itertools.islice(itertools.combinations(ids, 2), max_pairs), max_pairs
+
+	# Pair number k is (i, j) for the first i such that the pairs of the rows before it (i, ...) reach k
+	def unrank(ranks):
+		i = 0
+		first = 0
+		for k in ranks:
+			while k >= first + len(ids) - 1 - i:
+				first += len(ids) - 1 - i
+				i += 1
+			yield ids[i], ids[i + 1 + k - first]
+
+	return unrank(sorted(random.Random(str(c)).sample(range(total), max_pairs))), max_pairs
+
+def write_pairs(matches, clusters, max_pairs=None, sample=False, truncated=None):
+
+	# Stream every unordered pair of each cluster (key, ids) exactly once (combinations of its sorted ids), cluster by cluster, without keeping them in memory
+	# (matches: a text file or an object with writerows). Clusters with more than max_pairs pairs are truncated (see cluster_pairs)
+	writer = pair_writer(matches)
+	count = 0
+
+	for c, ids in clusters:
+		if len(ids) > 1:
+			pairs, written = cluster_pairs(c, ids, max_pairs, sample, truncated)
+			writer.writerows(pairs)
+			count += written
+
+	return count
+
+def write_clusters(matches, clusters):
+
+	# Write one JSON line per cluster (key, ids) with more than one specification, for consumers not needing the expanded pairs
+	count = 0
+
+	for c, ids in clusters:
+		if len(ids) > 1:
+			matches.write(json.dumps({'cluster': c, 'spec_ids': sorted(ids)}) + '\n')
+			count += 1
+
+	return count
 
-	identities = set()
-	for c in clusters.keys():
-		if len(clusters[c]) > 1:
-			for i in clusters[c]:
-				for j in clusters[c]:
-					if i < j:
-						identities.add((i, j))
-					if i > j:
-						identities.add((j, i))
+def write_assignments(matches, clusters):
 
-	identities = list(identities)
-	identities = pd.DataFrame(identities, columns = ['left_spec_id', 'right_spec_id'])
+	# One CSV row (id, entity) per specification, in id order
+	writer = csv.writer(matches, lineterminator='\n')
+	assignments = sorted((spec_id, c) for c, ids in clusters for spec_id in ids)
+	writer.writerows(assignments)
 
-	print(identities)
+	return len(assignments)
 
-	couples = pd.concat([couples, identities])
+def cpu_time():
 
-	couples.to_csv('matches_from_solved.csv', index=False)
+	# CPU time of this process and of its terminated children (the workers, once the pool has been joined)
+	times = os.times()
+	return times.user + times.system + times.children_user + times.children_system
+
+def size_histogram(sizes):
+
+	# Number of clusters by size, in power of two buckets
+	histogram = collections.Counter(1 << (size - 1).bit_length() for size in sizes)
+	return dict(('<=%d' % size, count) for size, count in sorted(histogram.items()))
+
+class Metrics:
+
+	# Timings and statistics of a run, saved as a JSON report. Stages named in profile run under cProfile (statistics saved in
+	# profile_<stage>.prof), the ones in trace_memory under tracemalloc (only allocations of the main process are seen by both)
+	def __init__(self, profile=None, trace_memory=None):
+		self.report = {'stages': {}}
+		self.profile = set(profile or [])
+		self.trace_memory = set(trace_memory or [])
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		# The stage can add its own statistics (e.g. 'records', for the throughput) to the yielded dictionary
+		stage = {}
+		profiler = None
+		if name in self.profile:
+			profiler = cProfile.Profile()
+			profiler.enable()
+		if name in self.trace_memory:
+			tracemalloc.start()
+		wall = time.perf_counter()
+		cpu = cpu_time()
+
+		yield stage
+
+		stage['wall_seconds'] = time.perf_counter() - wall
+		stage['cpu_seconds'] = cpu_time() - cpu
+		if 'records' in stage and stage['wall_seconds'] > 0:
+			stage['records_per_second'] = stage['records'] / stage['wall_seconds']
+		if profiler is not None:
+			profiler.disable()
+			profiler.dump_stats('profile_' + name + '.prof')
+			stage['profile'] = 'profile_' + name + '.prof'
+		if name in self.trace_memory:
+			allocations = tracemalloc.take_snapshot().statistics('lineno')
+			stage['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+			stage['top_allocations'] = [str(allocation) for allocation in allocations[:10]]
+			tracemalloc.stop()
+		self.report['stages'][name] = stage
+
+	def add_specs(self, store):
+		brands = store.columns['brand']
+		solved = np.bincount(brands[store.solved], minlength=len(store.brands.strings))
+		unsolved = np.bincount(brands[~store.solved], minlength=len(store.brands.strings))
+		self.report['specs'] = {'solved': int(solved.sum()), 'unsolved': int(unsolved.sum())}
+		self.report['brands'] = dict((brand, {'solved': int(solved[code]), 'unsolved': int(unsolved[code])})
+									 for code, brand in sorted(enumerate(store.brands.strings), key=lambda b: b[1]))
+
+	def add_pipeline(self, stage_stats):
+		# Records and busy seconds of the stages of the workers, summed over them
+		self.report['pipeline'] = dict((stage, {'records': records, 'seconds': seconds, 'records_per_second': records / seconds if seconds > 0 else None})
+									   for stage, (records, seconds) in stage_stats.items())
+
+	def add_clusters(self, name, cluster_sizes, largest=10):
+		# cluster_sizes: (key, size) of every cluster
+		sizes = [size for c, size in cluster_sizes]
+		self.report.setdefault('clusters', {})[name] = {'count': len(sizes), 'size_histogram': size_histogram(sizes),
+			'largest': [[c, size] for c, size in sorted(cluster_sizes, key=lambda c: -c[1])[:largest]]}
+
+	def save(self, path):
+		# Peak resident memory in kB (on Linux) of this process and of the largest of its children
+		if resource is not None:
+			self.report['peak_memory_kb'] = {'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+											 'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+		with open(path, 'w') as data:
+			json.dump(self.report, data, indent=1)
+
+def feed_shards(shards, slots):
+
+	# Shards handed to the pool only while a slot is free: the main process frees one for each shard it has consumed
+	for shard in shards:
+		slots.acquire()
+		yield shard
+
+def resolve_shards(args, shards, cache_stats, stage_stats):
+
+	# The main process keeps its own cache: it resolves the shards in serial runs and collects the titles to be persisted
+	init_worker(args.rules, args.cache_size, args.cache_file, args.io_threads, args.read_ahead)
+
+	# Shards are yielded in the order they were created, so the result is the same whatever the number of workers.
+	# Workers read (with their reader threads), parse, normalize and resolve; the main process collects the results. At most
+	# queue_size shards are being resolved or waiting to be collected, so that workers never get too far ahead of the main process
+	if args.workers > 1:
+		pool = multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args.rules, args.cache_size, args.cache_file, args.io_threads, args.read_ahead))
+		slots = threading.Semaphore(args.queue_size if args.queue_size is not None else 4 * args.workers)
+		results = pool.imap(read_shard, feed_shards(shards, slots))
+	else:
+		pool = None
+		slots = None
+		results = map(read_shard, shards)
+
+	for solved, unsolved, (hits, misses), counters, new_entries, read_titles in results:
+		cache_stats[0] += hits
+		cache_stats[1] += misses
+		for stage, (records, seconds) in counters.items():
+			stage_stats[stage][0] += records
+			stage_stats[stage][1] += seconds
+		for page_title, result in new_entries:
+			title_cache.add(page_title, result)
+		yield solved, unsolved, read_titles
+		if slots is not None:
+			slots.release()
+
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	if args.cache_file is not None:
+		title_cache.save(args.cache_file)
+
+def spec_cluster(camera):
+
+	# Solved specifications are clustered by brand and model, unsolved ones by identical page title
+	if 'brand_n_model' in camera:
+		return 1, camera['brand_n_model']
+	return 0, camera['page_title']
+
+def open_state(path):
+
+	connection = sqlite3.connect(path)
+	connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+	connection.execute('CREATE TABLE IF NOT EXISTS specs (id TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, solved INTEGER, cluster TEXT, normalized TEXT, brand TEXT)')
+	connection.execute('CREATE INDEX IF NOT EXISTS specs_cluster ON specs (solved, cluster)')
+	connection.execute('CREATE INDEX IF NOT EXISTS specs_brand ON specs (brand)')
+
+	return connection
+
+def save_rules_meta(connection, rules):
+
+	# Fingerprints and tables the resolutions of the state were computed with
+	meta = {'code': code_fingerprint(), 'normalization': rules.normalization_fingerprint, 'aliases': json.dumps(rules.aliases, sort_keys=True),
+			'brands': json.dumps(sorted(rules.brands)), 'brand_rules': json.dumps(rules.brand_fingerprints, sort_keys=True), 'default_rules': rules.default_fingerprint}
+	connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', meta.items())
+
+def save_state(path, rules, rows):
+
+	# The state is rebuilt from scratch after a full run
+	if os.path.exists(path):
+		os.remove(path)
+
+	connection = open_state(path)
+	with connection:
+		save_rules_meta(connection, rules)
+		connection.executemany('INSERT INTO specs VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+	connection.close()
+
+def rules_changes(connection, rules):
+
+	# What has changed in the rules since the state was saved: None if everything must be resolved again (code or normalization
+	# tables changed), otherwise the brands whose rules changed, the tokens whose alias changed and the tokens added to or removed
+	# from the brands
+	meta = dict(connection.execute('SELECT name, value FROM meta'))
+	if meta.get('code') != code_fingerprint() or meta.get('normalization') != rules.normalization_fingerprint:
+		return None
+
+	old_fingerprints = json.loads(meta['brand_rules'])
+	brands = set(brand for brand in set(old_fingerprints) | set(rules.brand_fingerprints)
+				 if old_fingerprints.get(brand, meta['default_rules']) != rules.brand_fingerprints.get(brand, rules.default_fingerprint))
+	if meta['default_rules'] != rules.default_fingerprint:
+		brands.add(None) # brands without rules of their own
+
+	old_aliases = json.loads(meta['aliases'])
+	alias_tokens = set(token for token in set(old_aliases) | set(rules.aliases) if old_aliases.get(token) != rules.aliases.get(token))
+	brand_tokens = set(json.loads(meta['brands'])) ^ rules.brands
+
+	return brands, alias_tokens, brand_tokens
+
+def cross_pairs(left, right):
+
+	# Unordered pairs with an element from each of two disjoint sets of ids
+	for i in left:
+		for j in right:
+			yield (i, j) if i < j else (j, i)
+
+def update(args):
+
+	metrics = Metrics(args.profile, args.trace_memory)
+
+	# (opening a missing state would create an empty one)
+	if not os.path.exists(args.state):
+		sys.exit('no state at ' + args.state + ', run match --state first')
+	connection = open_state(args.state)
+	changes = rules_changes(connection, load_rules(args.rules))
+	if changes is None:
+		sys.exit(args.state + ' was built with other code or normalization tables: run match again to rebuild it')
+
+	# Find files added, changed or deleted since the state was saved (by modification time and size)
+	with metrics.stage('scan') as stage:
+		known = dict((spec_id, (mtime, size)) for spec_id, mtime, size in connection.execute('SELECT id, mtime, size FROM specs'))
+		shards, stats = make_shards(args.path, args.shard_size, with_stats=True)
+
+		changed_shards = []
+		changed_stats = {}
+		seen = set()
+
+		for shard_index, (path, folder_name, file_names, titles) in enumerate(shards):
+			changed_names = []
+			changed_titles = []
+			for i in range(len(file_names)):
+				spec_id = str(folder_name) + '//' + str(file_names[i][:-5])
+				seen.add(spec_id)
+				if known.get(spec_id) != stats[shard_index][spec_id]:
+					changed_names.append(file_names[i])
+					changed_titles.append(titles[i] if titles is not None else None)
+					changed_stats[spec_id] = stats[shard_index][spec_id]
+			if len(changed_names) > 0:
+				changed_shards.append((path, folder_name, changed_names, changed_titles if titles is not None else None))
+
+		deleted = sorted(spec_id for spec_id in known if spec_id not in seen)
+		stage['files'] = len(seen)
+
+	# Resolve only new and changed files
+	new_clusters = {}
+	new_titles = {}
+	cache_stats = [0, 0]
+	stage_stats = dict((stage, [0, 0.0]) for stage in PIPELINE_STAGES)
+
+	with metrics.stage('resolve') as stage:
+		for solved, unsolved, read_titles in resolve_shards(args, changed_shards, cache_stats, stage_stats):
+			for camera in solved + unsolved:
+				new_clusters[camera['id']] = spec_cluster(camera)
+				new_titles[camera['id']] = camera['normalized'], camera['brand']
+		stage['records'] = len(new_clusters)
+
+	# Resolve again, from their normalized titles (files are not read), unchanged specifications affected by a change of the rules:
+	# those of brands whose rules changed, and those with a token whose alias changed or that became (or is no more) a brand
+	with metrics.stage('rules') as stage:
+		brands, alias_tokens, brand_tokens = changes
+		if None in brands or len(alias_tokens) > 0 or len(brand_tokens) > 0:
+			candidates = connection.execute('SELECT id, normalized, brand FROM specs')
+		else:
+			candidates = connection.execute('SELECT id, normalized, brand FROM specs WHERE brand IN (%s)' % ', '.join('?' * len(brands)), sorted(brands))
+
+		rechecked = 0
+		for spec_id, normalized, brand in candidates.fetchall():
+			if spec_id in new_clusters or spec_id not in seen:
+				continue
+			if not (brand in brands or (None in brands and brand not in rules.brand_fingerprints)):
+				tokens = normalized.split()
+				if alias_tokens.isdisjoint(tokens) and brand_tokens.isdisjoint(rules.aliases.get(t, t) for t in tokens):
+					continue
+			camera = read_spec(spec_id, normalized)
+			new_clusters[spec_id] = spec_cluster(camera)
+			new_titles[spec_id] = normalized, camera['brand']
+			changed_stats[spec_id] = known[spec_id]
+			rechecked += 1
+		stage['records'] = rechecked
+
+	with metrics.stage('delta') as stage:
+		# Collect the specifications leaving and joining each affected cluster
+		old_clusters = {}
+		for spec_id in list(new_clusters.keys()) + deleted:
+			if spec_id in known:
+				old_clusters[spec_id] = tuple(connection.execute('SELECT solved, cluster FROM specs WHERE id = ?', (spec_id,)).fetchone())
+
+		affected = collections.defaultdict(lambda: (set(), set()))
+		for spec_id, cluster in old_clusters.items():
+			if new_clusters.get(spec_id) != cluster:
+				affected[cluster][0].add(spec_id)
+		for spec_id, cluster in new_clusters.items():
+			if old_clusters.get(spec_id) != cluster:
+				affected[cluster][1].add(spec_id)
+
+		# Pairs removed: among leaving specifications and between them and the staying ones; pairs added: the same for joining specifications.
+		# Specifications moving together from a cluster to another (e.g. after a change of the rules) keep their pairs
+		added = 0
+		removed = 0
+
+		with open_output(args.delta) as delta:
+			writer = csv.writer(delta, lineterminator='\n')
+			writer.writerow(['left_spec_id', 'right_spec_id', 'operation'])
+
+			for cluster in sorted(affected.keys()):
+				leaving, joining = affected[cluster]
+				members = set(spec_id for (spec_id,) in connection.execute('SELECT id FROM specs WHERE solved = ? AND cluster = ?', cluster))
+				staying = sorted(members - leaving)
+
+				moving = [pair for pair in itertools.combinations(sorted(leaving), 2) if pair[0] not in new_clusters or new_clusters[pair[0]] != new_clusters.get(pair[1])]
+				for pair in itertools.chain(moving, cross_pairs(sorted(leaving), staying)):
+					writer.writerow(pair + ('remove',))
+					removed += 1
+				moving = [pair for pair in itertools.combinations(sorted(joining), 2) if pair[0] not in old_clusters or old_clusters[pair[0]] != old_clusters.get(pair[1])]
+				for pair in itertools.chain(moving, cross_pairs(sorted(joining), staying)):
+					writer.writerow(pair + ('add',))
+					added += 1
+		stage['records'] = added + removed
+
+	with metrics.stage('state') as stage:
+		with connection:
+			connection.executemany('DELETE FROM specs WHERE id = ?', ((spec_id,) for spec_id in deleted))
+			connection.executemany('INSERT OR REPLACE INTO specs VALUES (?, ?, ?, ?, ?, ?, ?)',
+								   ((spec_id,) + tuple(changed_stats[spec_id]) + cluster + new_titles[spec_id] for spec_id, cluster in new_clusters.items()))
+			save_rules_meta(connection, rules)
+		connection.close()
+		stage['records'] = len(new_clusters) + len(deleted)
+
+	print(time.time() - start_time)
+	print('%d new or changed, %d deleted, %d resolved again for changed rules' % (len(new_clusters) - rechecked, len(deleted), rechecked))
+	print('title cache: %d hits, %d misses' % tuple(cache_stats))
+	print('%d pairs added, %d removed' % (added, removed))
+
+	if args.report is not None:
+		metrics.report['changes'] = {'new_or_changed': len(new_clusters) - rechecked, 'deleted': len(deleted), 'resolved_for_rules': rechecked, 'affected_clusters': len(affected)}
+		metrics.report['pairs'] = {'added': added, 'removed': removed}
+		metrics.report['title_cache'] = {'hits': cache_stats[0], 'misses': cache_stats[1]}
+		metrics.add_pipeline(stage_stats)
+		metrics.save(args.report)
+
+def match(args):
+
+	metrics = Metrics(args.profile, args.trace_memory)
+
+	# Read JSON specifications (only new or changed ones, if a snapshot is used)
+	# (an archive is only opened here: it is read while its shards are resolved)
+	with metrics.stage('scan') as scan:
+		snapshot = Snapshot(args.snapshot) if args.snapshot is not None else None
+		shards, stats = make_shards(args.path, args.shard_size, snapshot, args.state is not None)
+
+	snapshot_changed = False
+
+	store = SpecStore(args.state is not None)
+	cache_stats = [0, 0]
+	stage_stats = dict((stage, [0, 0.0]) for stage in PIPELINE_STAGES)
+
+	with metrics.stage('resolve') as stage:
+		for shard_index, (solved, unsolved, read_titles) in enumerate(resolve_shards(args, shards, cache_stats, stage_stats)):
+			# Shards come back in order, and the stats of a shard are known once it has been handed out
+			for camera in solved + unsolved:
+				store.add(camera, stats[shard_index][camera['id']] if args.state is not None else None)
+
+			if snapshot is not None:
+				for i, title in read_titles:
+					shards[shard_index][3][i] = title
+				snapshot_changed = snapshot_changed or len(read_titles) > 0
+
+		# The snapshot is rewritten only if some file has been added, changed or deleted
+		if snapshot is not None and (snapshot_changed or len(store) != snapshot.size):
+			snapshot_writer = SnapshotWriter()
+			for shard_index, (path, folder_name, file_names, titles) in enumerate(shards):
+				for spec_id, title in zip(stats[shard_index], titles):
+					snapshot_writer.add(spec_id, title, stats[shard_index][spec_id][0], stats[shard_index][spec_id][1])
+			snapshot_writer.save(args.snapshot)
+
+		store.freeze()
+		stage['records'] = len(store)
+		scan['files'] = len(store)
+
+	mid_time = time.time()
+	print(mid_time - start_time)
+
+	print(int(store.solved.sum()))
+	print(len(store) - int(store.solved.sum()))
+	print('title cache: %d hits, %d misses' % tuple(cache_stats))
+
+	pairs = {}
+	truncated = []
+	limits = {'max_pairs': args.max_cluster_pairs, 'sample': args.giant_clusters == 'sample', 'truncated': truncated}
+
+	# Clusters are grouped in the store and expanded into ids one at a time, while they are written
+	with open_output(args.output, args.format) as output:
+		# Pairs are written as they come or, with --sort-pairs, sorted through runs spilled to disk beyond --memory-budget
+		if args.format == 'pairs':
+			output.write('left_spec_id,right_spec_id\n')
+		sorter = PairSorter(pair_writer(output), args.memory_budget << 20, os.path.dirname(os.path.abspath(args.output))) if args.sort_pairs else None
+		matches = sorter if sorter is not None else output
+
+		# Closed transitively, all the matches are written as entities
+		if args.transitive:
+			with metrics.stage('components') as stage:
+				groups = similar = None
+				if args.similarity is not None:
+					groups = similarity_groups(store, args.blocking_scope)
+					similar, blocking_stats = similar_titles(groups, args.similarity, args.max_block)
+					print(json.dumps(blocking_stats))
+					stage.update(blocking_stats)
+				entities = transitive_clusters(store, groups, similar)
+				stage['records'] = len(store)
+
+			with metrics.stage('write') as stage:
+				if args.format in ('pairs', 'parquet'):
+					pairs['entities'] = write_pairs(matches, entities, **limits)
+				elif args.format == 'clusters':
+					pairs['entities'] = write_clusters(matches, entities)
+				else:
+					matches.write('spec_id,entity_id\n')
+					pairs['entities'] = write_assignments(matches, entities)
+				print(pairs['entities'])
+				stage['records'] = pairs['entities']
+		else:
+			with metrics.stage('write') as stage:
+				# Get matches from solved specifications
+				clusters = store.clusters('label', True)
+
+				# Find identical strings in unsolved specifications
+				identities = store.clusters('title', False)
+
+				if args.format in ('pairs', 'parquet'):
+					pairs['solved'] = write_pairs(matches, clusters, **limits)
+					pairs['identical_titles'] = write_pairs(matches, identities, **limits)
+				else:
+					pairs['solved'] = write_clusters(matches, clusters)
+					pairs['identical_titles'] = write_clusters(matches, identities)
+				print(pairs['solved'])
+				print(pairs['identical_titles'])
+				stage['records'] = pairs['solved'] + pairs['identical_titles']
+
+			# Match unsolved specifications (and, optionally, solved ones) with similar titles
+			if args.similarity is not None:
+				with metrics.stage('similarity') as stage:
+					groups = similarity_groups(store, args.blocking_scope)
+					similar, blocking_stats = similar_titles(groups, args.similarity, args.max_block)
+					print(json.dumps(blocking_stats))
+					pairs['similar_titles'] = write_similar(matches, groups, similar, args.format)
+					print(pairs['similar_titles'])
+					stage.update(blocking_stats)
+					stage['records'] = len(groups)
+
+		if sorter is not None:
+			with metrics.stage('sort') as stage:
+				sorter.close()
+				stage['spilled_runs'] = len(sorter.runs)
+				stage['duplicates'] = sorter.duplicates
+
+	if len(truncated) > 0:
+		print('%d clusters truncated to %d pairs' % (len(truncated), args.max_cluster_pairs))
+
+	# Save clusters and file stats, for later incremental updates
+	if args.state is not None:
+		with metrics.stage('state') as stage:
+			save_state(args.state, rules, store.state_rows())
+			stage['records'] = len(store)
 
 	final_time = time.time()
 	print(final_time - mid_time)
 
+	if args.report is not None:
+		metrics.add_specs(store)
+		metrics.add_clusters('solved', store.cluster_sizes('label', True))
+		metrics.add_clusters('identical_titles', store.cluster_sizes('title', False))
+		if args.transitive:
+			metrics.add_clusters('entities', [(c, len(ids)) for c, ids in entities])
+		metrics.report[{'pairs': 'pairs', 'parquet': 'pairs', 'clusters': 'clusters_written', 'assignments': 'assignments_written'}[args.format]] = pairs
+		metrics.report['truncated_clusters'] = truncated
+		metrics.report['title_cache'] = {'hits': cache_stats[0], 'misses': cache_stats[1]}
+		metrics.add_pipeline(stage_stats)
+		metrics.save(args.report)
+
+def similarity_groups(store, blocking_scope):
+
+	# Groups of specifications (title, solved, ids) compared by similar_titles: unsolved ones, and with scope all also solved ones
+	groups = [(title, False, ids) for title, ids in store.clusters('title', False, 1)]
+	if blocking_scope == 'all':
+		groups += [(title, True, ids) for title, ids in store.clusters('title', True, 1)]
+
+	return groups
+
+def similar_titles(groups, threshold, max_block):
+
+	# Find pairs of groups of specifications (title, solved, ids) whose titles have Jaccard similarity on tokens at least threshold,
+	# skipping pairs of solved groups (already matched by brand and model). Tokens found in more than max_block titles are stop tokens
+	# and are ignored. Candidates come from a token inverted index with prefix filtering: the tokens of each title are sorted by
+	# increasing frequency and only the first ones are indexed, enough for two titles with similarity at least threshold to share one
+	token_sets = [frozenset(title.split()) for title, solved, ids in groups]
+	frequencies = collections.Counter(t for tokens in token_sets for t in tokens)
+	stop_tokens = frozenset(t for t, f in frequencies.items() if f > max_block)
+
+	index = collections.defaultdict(list)
+	pairs = []
+	candidates_count = 0
+
+	for g in range(len(groups)):
+		tokens = token_sets[g] - stop_tokens
+		token_sets[g] = tokens
+		if len(tokens) == 0:
+			continue
+
+		ordered = sorted(tokens, key=lambda t: (frequencies[t], t))
+		prefix = ordered[:len(ordered) - math.ceil(threshold * len(ordered) - 1e-9) + 1]
+
+		candidates = set()
+		for t in prefix:
+			candidates.update(index[t])
+			index[t].append(g)
+
+		candidates_count += len(candidates)
+		for c in sorted(candidates):
+			if groups[c][1] and groups[g][1]:
+				continue
+			if len(token_sets[c] & tokens) / len(token_sets[c] | tokens) >= threshold:
+				pairs.append((c, g))
+
+	# Block statistics, to tune threshold and max_block
+	block_sizes = sorted(len(block) for block in index.values())
+	stats = {'titles': len(groups), 'tokens': len(frequencies), 'stop_tokens': len(stop_tokens), 'blocks': len(block_sizes),
+			 'max_block_size': block_sizes[-1] if block_sizes else 0, 'mean_block_size': sum(block_sizes) / len(block_sizes) if block_sizes else 0,
+			 'block_size_histogram': size_histogram(block_sizes),
+			 'candidates': candidates_count, 'similar_pairs': len(pairs)}
+
+	return pairs, stats
+
+def write_similar(matches, groups, pairs, format):
+
+	# Expand pairs of similar titles into pairs of specifications (or write them as JSON lines with the ids on each side)
+	writer = pair_writer(matches) if format != 'clusters' else None
+	count = 0
+
+	for a, b in pairs:
+		if format != 'clusters':
+			left = sorted(groups[a][2])
+			right = sorted(groups[b][2])
+			writer.writerows(sorted(cross_pairs(left, right)))
+			count += len(left) * len(right)
+		else:
+			matches.write(json.dumps({'similar_titles': [groups[a][0], groups[b][0]], 'left_spec_ids': sorted(groups[a][2]), 'right_spec_ids': sorted(groups[b][2])}) + '\n')
+			count += 1
+
+	return count
+
+def read_predictions(path, codes):
+
+	# Matches written by match (pairs, clusters or assignments, recognized by their first line, or Parquet pairs), restricted to the
+	# specifications of the labelled pairs (codes: their ids as an index): the cluster of each of them (-1 if none) and the keys of
+	# the other predicted pairs (pairs files and similar titles, as given by pair_keys)
+	cluster_of = np.full(len(codes), -1, dtype=np.int64)
+	keys = []
+
+	if path.endswith('.parquet'):
+		pairs = pd.read_parquet(path)
+		return cluster_of, np.unique(pair_keys(codes.get_indexer(pairs['left_spec_id']), codes.get_indexer(pairs['right_spec_id']), len(codes)))
+
+	with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path, 'r')) as matches:
+		first = matches.readline()
+		matches.seek(0)
+		if first.startswith('left_spec_id,'):
+			pairs = pd.read_csv(matches, dtype=str)
+			keys.append(pair_keys(codes.get_indexer(pairs['left_spec_id']), codes.get_indexer(pairs['right_spec_id']), len(codes)))
+		elif first.startswith('spec_id,'):
+			assignments = pd.read_csv(matches, dtype=str)
+			found = codes.get_indexer(assignments['spec_id'])
+			cluster_of[found[found >= 0]] = assignments['entity_id'].to_numpy()[found >= 0].astype(np.int64)
+		else:
+			# Clusters are expanded only on the labelled specifications, and never into pairs
+			for c, line in enumerate(matches):
+				cluster = json.loads(line)
+				if 'spec_ids' in cluster:
+					found = codes.get_indexer(cluster['spec_ids'])
+					cluster_of[found[found >= 0]] = c
+				else:
+					left = codes.get_indexer(cluster['left_spec_ids'])
+					right = codes.get_indexer(cluster['right_spec_ids'])
+					left, right = left[left >= 0], right[right >= 0]
+					keys.append(pair_keys(np.repeat(left, len(right)), np.tile(right, len(left)), len(codes)))
+
+	return cluster_of, np.unique(np.concatenate(keys)) if len(keys) > 0 else np.zeros(0, dtype=np.int64)
+
+def pair_keys(left, right, count):
+
+	# Integer key of each unordered pair of specification codes (from 0 to count - 1); pairs with an unknown side (-1) get -1
+	left = np.asarray(left, dtype=np.int64)
+	right = np.asarray(right, dtype=np.int64)
+	keys = np.minimum(left, right) * count + np.maximum(left, right)
+	keys[(left < 0) | (right < 0)] = -1
+
+	return keys
+
+def scores(tp, fp, fn):
+
+	precision = tp / (tp + fp) if tp + fp > 0 else None
+	recall = tp / (tp + fn) if tp + fn > 0 else None
+	f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+
+	return {'true_positives': tp, 'false_positives': fp, 'false_negatives': fn, 'precision': precision, 'recall': recall, 'f1': f1}
+
+def evaluate(args):
+
+	# Precision, recall and F1 of the matches in --output against the labelled pairs (left_spec_id, right_spec_id, label): a labelled
+	# pair is predicted if its specifications are in the same cluster or the pair has been written. Specifications of labelled pairs
+	# are resolved again, to give each pair a brand (that of its specifications, "mixed" if they differ) and the clusters to blame
+	labels = pd.read_csv(args.labels, dtype={'left_spec_id': str, 'right_spec_id': str, 'label': int})
+	codes = pd.Index(pd.unique(pd.concat([labels['left_spec_id'], labels['right_spec_id']], ignore_index=True)))
+	left = codes.get_indexer(labels['left_spec_id'])
+	right = codes.get_indexer(labels['right_spec_id'])
+	positive = labels['label'].to_numpy() == 1
+
+	cluster_of, predicted_keys = read_predictions(args.output, codes)
+	predicted = ((cluster_of[left] == cluster_of[right]) & (cluster_of[left] >= 0)) | np.isin(pair_keys(left, right, len(codes)), predicted_keys)
+
+	# Brand and cluster (brand and model, or title if unsolved) of the labelled specifications
+	shards, stats = make_shards(args.path, args.shard_size)
+	labelled = set(codes)
+	shards = [(path, folder_name, [file_names[i] for i in range(len(file_names)) if str(folder_name) + '//' + str(file_names[i][:-5]) in labelled],
+			   [titles[i] for i in range(len(file_names)) if str(folder_name) + '//' + str(file_names[i][:-5]) in labelled] if titles is not None else None)
+			  for path, folder_name, file_names, titles in shards]
+	brand_of = np.full(len(codes), 'unknown', dtype=object)
+	key_of = np.full(len(codes), 'unknown', dtype=object)
+	stage_stats = dict((stage, [0, 0.0]) for stage in PIPELINE_STAGES)
+	for solved, unsolved, read_titles in resolve_shards(args, [shard for shard in shards if len(shard[2]) > 0], [0, 0], stage_stats):
+		for camera in solved + unsolved:
+			code = codes.get_loc(camera['id'])
+			brand_of[code] = camera['brand']
+			key_of[code] = spec_cluster(camera)[1]
+
+	brands = np.where(brand_of[left] == brand_of[right], brand_of[left], 'mixed')
+	outcomes = pd.DataFrame({'brand': brands, 'tp': predicted & positive, 'fp': predicted & ~positive, 'fn': ~predicted & positive})
+	by_brand = outcomes.groupby('brand')[['tp', 'fp', 'fn']].sum()
+
+	fp = outcomes['fp'].to_numpy()
+	fn = outcomes['fn'].to_numpy()
+	false_positives = collections.Counter(key_of[left[fp]].tolist())
+	false_negatives = collections.Counter(zip(key_of[left[fn]].tolist(), key_of[right[fn]].tolist()))
+
+	result = {'labelled_pairs': len(labels), 'positive_pairs': int(positive.sum()), 'predicted_pairs': int(predicted.sum()),
+			  'overall': scores(int(outcomes['tp'].sum()), int(fp.sum()), int(fn.sum())),
+			  'brands': dict((brand, scores(int(row.tp), int(row.fp), int(row.fn))) for brand, row in by_brand.sort_values('tp', ascending=False).iterrows()),
+			  'false_positive_clusters': [[c, count] for c, count in false_positives.most_common(args.top)],
+			  'false_negative_clusters': [[list(c), count] for c, count in false_negatives.most_common(args.top)]}
+
+	print(json.dumps(result, indent=1))
+	if args.report is not None:
+		with open(args.report, 'w') as report:
+			json.dump(result, report, indent=1)
+
+def source_part(folder_name, parts):
+
+	# Part of the map step a source belongs to (by a hash of its name, stable across runs and machines)
+	return zlib.crc32(str(folder_name).encode('utf-8')) % parts
+
+def title_bucket(page_title, buckets):
+
+	return zlib.crc32(page_title.encode('utf-8')) % buckets
+
+def partition_order(name):
+
+	# Partial files are merged (and their matches written) brand by brand in brand order, which is also the order of the solved
+	# clusters (keys start with the brand), then title bucket by title bucket
+	kind, key = name[:-len('.jsonl')].split('-', 1)
+	return (0, urllib.parse.unquote(key)) if kind == 'solved' else (1, int(key))
+
+def map_part(args):
+
+	# Map step: resolve the sources of one part and write its clusters (singletons included, as they may grow with the other
+	# parts) as JSON lines, into one partial file per brand for solved specifications and one per title bucket for unsolved ones
+	shards, stats = make_shards(args.path, args.shard_size)
+	shards = (shard for shard in shards if source_part(shard[1], args.parts) == args.part)
+
+	store = SpecStore()
+	cache_stats = [0, 0]
+	stage_stats = dict((stage, [0, 0.0]) for stage in PIPELINE_STAGES)
+	for solved, unsolved, read_titles in resolve_shards(args, shards, cache_stats, stage_stats):
+		for camera in solved + unsolved:
+			store.add(camera)
+	store.freeze()
+
+	print(time.time() - start_time)
+	print(int(store.solved.sum()))
+	print(len(store) - int(store.solved.sum()))
+
+	# Written aside and then renamed, so that a reduce step never sees an incomplete part
+	folder = os.path.join(args.partials, 'part-%05d' % args.part)
+	if os.path.exists(folder + '.tmp'):
+		shutil.rmtree(folder + '.tmp')
+	os.makedirs(folder + '.tmp')
+
+	# Solved clusters come in key order, hence brand by brand
+	partial = None
+	brand = None
+	for c, ids in store.clusters('label', True, 1):
+		if c.split(' ', 1)[0] != brand:
+			if partial is not None:
+				partial.close()
+			brand = c.split(' ', 1)[0]
+			partial = open(os.path.join(folder + '.tmp', 'solved-' + urllib.parse.quote(brand, safe='') + '.jsonl'), 'w', buffering=OUTPUT_BUFFER)
+		partial.write(json.dumps({'cluster': c, 'spec_ids': ids}) + '\n')
+	if partial is not None:
+		partial.close()
+
+	partials = {}
+	for c, ids in store.clusters('title', False, 1):
+		bucket = title_bucket(c, args.title_buckets)
+		if bucket not in partials:
+			partials[bucket] = open(os.path.join(folder + '.tmp', 'titles-%05d.jsonl' % bucket), 'w', buffering=OUTPUT_BUFFER)
+		partials[bucket].write(json.dumps({'cluster': c, 'spec_ids': ids}) + '\n')
+	for partial in partials.values():
+		partial.close()
+
+	if os.path.exists(folder):
+		shutil.rmtree(folder)
+	os.replace(folder + '.tmp', folder)
+
+# Suffix of the list of truncated clusters written by reduce next to its output
+TRUNCATED_SUFFIX = '.truncated.jsonl'
+
+def reduce_part(args):
+
+	# Reduce step: merge the partial files of every part, one brand (or title bucket) at a time, and write the matches of one part
+	# of them (contiguous in partition order, so that the outputs of the parts can be concatenated). Only the reduce step of the
+	# first part writes the CSV header
+	folders = sorted(os.path.join(args.partials, name) for name in os.listdir(args.partials) if name.startswith('part-') and not name.endswith('.tmp'))
+	names = sorted(set(name for folder in folders for name in os.listdir(folder)), key=partition_order)
+	names = names[args.part * len(names) // args.parts:(args.part + 1) * len(names) // args.parts]
+
+	pairs = {'solved': 0, 'identical_titles': 0}
+
+	truncated = []
+
+	with open_output(args.output) as matches:
+		if args.format == 'pairs' and args.part == 0:
+			matches.write('left_spec_id,right_spec_id\n')
+		for name in names:
+			clusters = collections.defaultdict(list)
+			for folder in folders:
+				if os.path.exists(os.path.join(folder, name)):
+					with open(os.path.join(folder, name), 'r') as partial:
+						for line in partial:
+							cluster = json.loads(line)
+							clusters[cluster['cluster']].extend(cluster['spec_ids'])
+			kind = 'solved' if name.startswith('solved-') else 'identical_titles'
+			if args.format == 'pairs':
+				pairs[kind] += write_pairs(matches, sorted(clusters.items()), args.max_cluster_pairs, args.giant_clusters == 'sample', truncated)
+			else:
+				pairs[kind] += write_clusters(matches, sorted(clusters.items()))
+
+	print(pairs['solved'])
+	print(pairs['identical_titles'])
+
+	# Truncated clusters are listed next to the output (the output of the process may not be kept, as with distribute)
+	with open(args.output + TRUNCATED_SUFFIX, 'w') as listing:
+		for cluster in truncated:
+			listing.write(json.dumps(cluster) + '\n')
+	if len(truncated) > 0:
+		print('%d clusters truncated to %d pairs' % (len(truncated), args.max_cluster_pairs))
+
+def run_processes(commands):
+
+	processes = [subprocess.Popen(command, stdout=subprocess.DEVNULL) for command in commands]
+	for command, process in zip(commands, processes):
+		if process.wait() != 0:
+			sys.exit(' '.join(command) + ' failed')
+
+def distribute(args):
+
+	# Local stand-in for several nodes: the map step of every part, then the reduce step of every part, each in its own process,
+	# and finally the outputs of the reduce steps concatenated into the output file
+	command = [sys.executable, os.path.abspath(__file__)]
+	common = ['--rules', args.rules, '--partials', args.partials, '--parts', str(args.parts)]
+	# (gzipped outputs stay so: a concatenation of gzip files is a gzip file)
+	outputs = [args.output + '.part-%05d' % part + ('.gz' if args.output.endswith('.gz') else '') for part in range(args.parts)]
+
+	# Partial files of previous runs (possibly split into more parts) must not be merged. Only the part folders are removed, and a
+	# folder holding anything else is refused rather than emptied (it is most likely not a folder of partial files)
+	if os.path.exists(args.partials):
+		names = os.listdir(args.partials)
+		others = [name for name in names if not re.fullmatch(r'part-\d{5}(\.tmp)?', name)]
+		if others:
+			sys.exit(args.partials + ' holds other files than partial ones (' + ', '.join(sorted(others)[:3]) + '), choose another --partials folder')
+		for name in names:
+			shutil.rmtree(os.path.join(args.partials, name))
+
+	run_processes([command + ['map', '--part', str(part), '--path', args.path, '--workers', '1', '--shard-size', str(args.shard_size), '--cache-size', str(args.cache_size),
+							  '--title-buckets', str(args.title_buckets)] + common for part in range(args.parts)])
+	map_time = time.time()
+	print(map_time - start_time)
+
+	limits = ['--max-cluster-pairs', str(args.max_cluster_pairs), '--giant-clusters', args.giant_clusters] if args.max_cluster_pairs is not None else []
+	run_processes([command + ['reduce', '--part', str(part), '--output', outputs[part], '--format', args.format] + limits + common for part in range(args.parts)])
+
+	with open(args.output, 'wb') as matches:
+		for output in outputs:
+			with open(output, 'rb') as part:
+				shutil.copyfileobj(part, matches, OUTPUT_BUFFER)
+			os.remove(output)
+	truncated = 0
+	with open(args.output + TRUNCATED_SUFFIX, 'w') as listing:
+		for output in outputs:
+			with open(output + TRUNCATED_SUFFIX, 'r') as part:
+				for line in part:
+					listing.write(line)
+					truncated += 1
+			os.remove(output + TRUNCATED_SUFFIX)
+	print(time.time() - map_time)
+	if truncated > 0:
+		print('%d clusters truncated to %d pairs' % (truncated, args.max_cluster_pairs))
+
+class Batcher:
+
+	# Micro-batching of the requests of the service: handler threads queue their titles, a single thread resolves whatever has arrived
+	# (up to batch_size titles, waiting at most batch_wait seconds for more) and wakes the handlers up. The resolver and its cache are
+	# only used by this thread
+	def __init__(self, resolver, batch_size, batch_wait):
+		self.resolver = resolver
+		self.batch_size = batch_size
+		self.batch_wait = batch_wait
+		self.requests = queue.Queue()
+		self.batches = 0
+		self.titles = 0
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def resolve(self, titles):
+		request = {'titles': titles, 'done': threading.Event()}
+		self.requests.put(request)
+		request['done'].wait()
+		return request['results']
+
+	def run(self):
+		while True:
+			batch = [self.requests.get()]
+			count = len(batch[0]['titles'])
+			deadline = time.perf_counter() + self.batch_wait
+			while count < self.batch_size:
+				try:
+					batch.append(self.requests.get(timeout=max(deadline - time.perf_counter(), 0)))
+				except queue.Empty:
+					break
+				count += len(batch[-1]['titles'])
+
+			results = self.resolver.resolve_many([title for request in batch for title in request['titles']])
+			self.batches += 1
+			self.titles += count
+			for request in batch:
+				request['results'] = results[:len(request['titles'])]
+				results = results[len(request['titles']):]
+				request['done'].set()
+
+class ResolutionHandler(http.server.BaseHTTPRequestHandler):
+
+	# GET /resolve?title=... resolves one title, POST /resolve with {"titles": [...]} (or {"title": ...}) a list of them; GET /stats gives
+	# the cache and batching statistics
+	def do_GET(self):
+		url = urllib.parse.urlsplit(self.path)
+		if url.path == '/resolve':
+			titles = urllib.parse.parse_qs(url.query).get('title')
+			if titles is None:
+				self.reply(400, {'error': 'missing title'})
+			else:
+				self.reply(200, self.server.batcher.resolve(titles[:1])[0])
+		elif url.path == '/stats':
+			batcher = self.server.batcher
+			self.reply(200, {'batches': batcher.batches, 'titles': batcher.titles, 'cache_hits': batcher.resolver.title_cache.hits, 'cache_misses': batcher.resolver.title_cache.misses})
+		else:
+			self.reply(404, {'error': 'unknown path'})
+
+	def do_POST(self):
+		if urllib.parse.urlsplit(self.path).path != '/resolve':
+			self.reply(404, {'error': 'unknown path'})
+			return
+		try:
+			request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+			titles = request['titles'] if 'titles' in request else [request['title']]
+			if not isinstance(titles, list):
+				raise ValueError('titles must be a list')
+			if not all(isinstance(title, str) for title in titles):
+				raise ValueError('titles must be strings')
+		except (ValueError, KeyError, TypeError) as error:
+			self.reply(400, {'error': str(error)})
+			return
+		results = self.server.batcher.resolve(titles)
+		self.reply(200, results if 'titles' in request else results[0])
+
+	def reply(self, status, body):
+		content = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+	def log_message(self, format, *args):
+		pass
+
+class TCPHTTPServer(http.server.ThreadingHTTPServer):
+
+	# Default backlog (5) makes clients retry connections after a second under concurrent requests
+	request_queue_size = 1024
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+	daemon_threads = True
+	request_queue_size = 1024
+
+	def get_request(self):
+		# Unix sockets have no client address, that the request handler expects
+		connection, address = super().get_request()
+		return connection, ('local', 0)
+
+def serve(args):
+
+	# Local service resolving single titles on demand (HTTP over TCP, or over a Unix socket with --socket)
+	batcher = Batcher(Resolver(args.rules, args.cache_size), args.batch_size, args.batch_wait / 1000)
+
+	if args.socket is not None:
+		if os.path.exists(args.socket):
+			os.remove(args.socket)
+		server = UnixHTTPServer(args.socket, ResolutionHandler)
+		print('serving on ' + args.socket)
+	else:
+		server = TCPHTTPServer((args.host, args.port), ResolutionHandler)
+		print('serving on http://' + args.host + ':' + str(args.port))
+	server.batcher = batcher
+	sys.stdout.flush()
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if args.socket is not None:
+			os.remove(args.socket)
+
+# Stages of match and update that can be profiled
+STAGES = ['scan', 'resolve', 'rules', 'components', 'write', 'similarity', 'sort', 'delta', 'state']
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Entity resolution on camera specifications')
+	parser.add_argument('command', nargs='?', choices=['match', 'update', 'serve', 'map', 'reduce', 'distribute', 'evaluate'], default='match', help='match: resolve the whole dataset and write all the matches; update: resolve only files added, changed or deleted since the state was saved and write the changed matches; serve: resolve single titles on demand as a local HTTP service; map: resolve the sources of one part into partial cluster files; reduce: merge the partial files of one part of the brands and title buckets and write their matches; distribute: run map and reduce for every part as separate processes; evaluate: precision, recall and F1 of the matches in --output against labelled pairs')
+	parser.add_argument('--path', default='Dataset/2013_camera_specs', help='folder containing one subfolder of JSON specifications per source, or a tar, zip or JSON-lines archive of them')
+	parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'), help='JSON file with normalization tables and brand rules')
+	parser.add_argument('--output', default='matches_from_solved.csv', help='CSV file the matches are written to')
+	parser.add_argument('--format', choices=['pairs', 'clusters', 'assignments', 'parquet'], default='pairs', help='write matches as CSV pairs, as JSON lines, one per cluster, (with --transitive) as CSV rows of id and entity, or as pairs in a Parquet file (needs pyarrow); text outputs whose name ends with .gz are gzipped')
+	parser.add_argument('--sort-pairs', action='store_true', help='write pairs sorted and without duplicates, spilling sorted runs to disk beyond --memory-budget')
+	parser.add_argument('--memory-budget', type=int, default=256, help='megabytes of pairs kept in memory by --sort-pairs before spilling them to disk')
+	parser.add_argument('--max-cluster-pairs', type=int, default=None, help='write at most this number of pairs of a cluster (truncated clusters are listed in the report)')
+	parser.add_argument('--giant-clusters', choices=['cap', 'sample'], default='cap', help='pairs written for clusters beyond --max-cluster-pairs: the first ones or a uniform sample')
+	parser.add_argument('--transitive', action='store_true', help='close the matches transitively (also joining unsolved specifications to solved ones with the same title) and write the resulting entities')
+	parser.add_argument('--similarity', type=float, default=None, help='also match specifications whose titles have at least this Jaccard similarity on tokens (disabled by default)')
+	parser.add_argument('--max-block', type=int, default=1000, help='tokens found in more titles than this are ignored by --similarity')
+	parser.add_argument('--blocking-scope', choices=['unsolved', 'all'], default='unsolved', help='titles compared by --similarity: only unsolved ones, or also solved ones (pairs of solved titles are never matched)')
+	parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes resolving specifications (default: number of cores)')
+	parser.add_argument('--io-threads', type=int, default=0, help='threads of each process reading files ahead of parsing, for slow (e.g. network) storage (0: files are read one at a time)')
+	parser.add_argument('--read-ahead', type=int, default=64, help='maximum number of files read ahead by the threads of a process')
+	parser.add_argument('--queue-size', type=int, default=None, help='maximum number of shards being resolved or waiting for the main process (default: 4 per worker)')
+	parser.add_argument('--shard-size', type=int, default=500, help='maximum number of files handed to a process at a time')
+	parser.add_argument('--cache-size', type=int, default=100000, help='maximum number of resolved titles cached by each process (0 disables the cache)')
+	parser.add_argument('--cache-file', default=None, help='file the title cache is loaded from and saved to between runs')
+	parser.add_argument('--snapshot', nargs='?', const='camera_specs.snapshot', default=None, help='snapshot file of ids and titles: only files changed since it was written are read again')
+	parser.add_argument('--state', default=None, help='state store (SQLite) of the clusters, saved by match and updated by update')
+	parser.add_argument('--delta', default='matches_delta.csv', help='CSV file the matches added and removed by update are written to')
+	parser.add_argument('--report', default=None, help='JSON file the report of the run (stage timings, memory, statistics on brands, clusters and pairs) is written to')
+	parser.add_argument('--profile', action='append', choices=STAGES, default=None, help='run a stage under cProfile (can be repeated; use --workers 1 to profile resolution)')
+	parser.add_argument('--trace-memory', action='append', choices=STAGES, default=None, help='run a stage under tracemalloc (can be repeated)')
+	parser.add_argument('--host', default='127.0.0.1', help='address the service listens on')
+	parser.add_argument('--port', type=int, default=8020, help='port the service listens on')
+	parser.add_argument('--socket', default=None, help='Unix socket the service listens on (instead of --host and --port)')
+	parser.add_argument('--batch-size', type=int, default=256, help='maximum number of titles the service resolves at a time')
+	parser.add_argument('--batch-wait', type=float, default=0.5, help='milliseconds the service waits for more titles before resolving a batch')
+	parser.add_argument('--partials', default='partials', help='folder of the partial cluster files written by map and read by reduce')
+	parser.add_argument('--parts', type=int, default=os.cpu_count(), help='number of parts sources (map) and brands and title buckets (reduce) are split into')
+	parser.add_argument('--part', type=int, default=0, help='part handled by map or reduce (from 0 to --parts - 1)')
+	parser.add_argument('--title-buckets', type=int, default=16, help='number of partial files unsolved specifications are split into by map, by a hash of their title')
+	parser.add_argument('--labels', default='sigmod_large_labelled_dataset.csv', help='CSV file of labelled pairs (left_spec_id, right_spec_id, label) used by evaluate')
+	parser.add_argument('--top', type=int, default=10, help='number of clusters with most false positives and false negatives listed by evaluate')
+	args = parser.parse_args()
+
+	if args.shard_size < 1:
+		parser.error('--shard-size must be at least 1')
+	if args.queue_size is not None and args.queue_size < 1:
+		parser.error('--queue-size must be at least 1')
+	if args.format == 'assignments' and not args.transitive:
+		parser.error('--format assignments requires --transitive')
+	if args.sort_pairs and args.format not in ('pairs', 'parquet'):
+		parser.error('--sort-pairs applies only to pairs')
+	if args.format == 'parquet' and pyarrow is None:
+		parser.error('--format parquet requires pyarrow')
+	if args.format == 'parquet' and args.command in ('map', 'reduce', 'distribute'):
+		parser.error('--format parquet cannot be used by map, reduce and distribute')
+	if args.sort_pairs and args.command in ('map', 'reduce', 'distribute'):
+		parser.error('--sort-pairs cannot be used by map, reduce and distribute')
+	if (args.transitive or args.similarity is not None) and args.command in ('map', 'reduce', 'distribute'):
+		parser.error('--transitive and --similarity cannot be used by map, reduce and distribute (clusters are merged brand by brand)')
+	if args.title_buckets < 1:
+		parser.error('--title-buckets must be at least 1')
+	if args.similarity is not None and not 0 < args.similarity <= 1:
+		parser.error('--similarity must be greater than 0 and at most 1')
+	if args.max_cluster_pairs is not None and args.max_cluster_pairs < 1:
+		parser.error('--max-cluster-pairs must be at least 1')
+	if args.command == 'update' and (args.sort_pairs or args.format == 'parquet' or args.max_cluster_pairs is not None):
+		parser.error('--sort-pairs, --format parquet and --max-cluster-pairs cannot be used by update (its delta is written as CSV pairs)')
+	if args.snapshot is not None and os.path.isfile(args.path):
+		parser.error('--snapshot cannot be used with an archive (titles are read from it in a single pass)')
+
+	if args.command == 'update':
+		if args.state is None:
+			parser.error('update requires --state')
+		update(args)
+	elif args.command == 'serve':
+		serve(args)
+	elif args.command == 'evaluate':
+		evaluate(args)
+	elif args.command in ('map', 'reduce', 'distribute'):
+		if not 0 <= args.part < args.parts:
+			parser.error('--part must be between 0 and --parts - 1')
+		if args.command == 'map':
+			map_part(args)
+		elif args.command == 'reduce':
+			reduce_part(args)
+		else:
+			distribute(args)
+	else:
+		match(args)
+
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file